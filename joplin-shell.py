@@ -4,14 +4,35 @@ joplin-shell.py
 Interactive shell for a Joplin database.sqlite file.
 """
 
+import io
 import os
+import re
+import errno
+import shutil
+import signal
 import sys
+import math
+import itertools
+import struct
 import sqlite3
 import argparse
+import json
+import hashlib
+import html
+import queue
+import tarfile
 import textwrap
+import tempfile
+import threading
+import time
+import zipfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from urllib.parse import quote
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 
 # Try to import readline, but don't fail if not available
 try:
@@ -21,6 +42,13 @@ except ImportError:
     readline = None
     READLINE_AVAILABLE = False
 
+# The markdown package renders HTML exports when installed; a minimal
+# built-in renderer is used otherwise
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
 # ----------------------------------------------------------------------
 # Helper functions
 # ----------------------------------------------------------------------
@@ -39,6 +67,34 @@ def print_wrapped(text: str, indent: int = 0, width: int = 80):
     )
     print(wrapper.fill(text))
 
+def bm25_from_matchinfo(matchinfo: bytes, *weights: float) -> float:
+    """
+    Compute an Okapi BM25 score from an FTS4 matchinfo(..., 'pcnalx') blob.
+
+    FTS4 has no built-in bm25(), so this is registered as an SQL function.
+    The result is negated to follow FTS5's convention: lower is better.
+    """
+    k1, b = 1.2, 0.75
+    info = struct.unpack(f"@{len(matchinfo) // 4}I", matchinfo)
+    phrases, cols, total_docs = info[0], info[1], info[2]
+    avg_lens = info[3:3 + cols]
+    doc_lens = info[3 + cols:3 + 2 * cols]
+    hits = info[3 + 2 * cols:]
+
+    score = 0.0
+    for phrase in range(phrases):
+        for col in range(cols):
+            weight = weights[col] if col < len(weights) else 1.0
+            base = 3 * (phrase * cols + col)
+            tf, docs_with_hit = hits[base], hits[base + 2]
+            if not weight or not tf:
+                continue
+            # The +1 (as in FTS5 and Joplin) keeps terms found in most documents positive
+            idf = math.log((total_docs - docs_with_hit + 0.5) / (docs_with_hit + 0.5) + 1)
+            norm = 1 - b + b * (doc_lens[col] / avg_lens[col] if avg_lens[col] else 1)
+            score += weight * idf * (tf * (k1 + 1)) / (tf + k1 * norm)
+    return -score
+
 # Enhanced terminal input with arrow key support
 command_history: List[str] = []
 current_input = ""
@@ -214,17 +270,249 @@ def safe_input(prompt: str = "") -> str:
         print()
         return ""
 
+# ----------------------------------------------------------------------
+# Folder tree cache
+# ----------------------------------------------------------------------
+class FolderNode:
+    """A single notebook in the in-memory folder tree."""
+
+    __slots__ = ("id", "title", "parent_id", "children")
+
+    def __init__(self, id: str, title: str, parent_id: str):
+        self.id = id
+        self.title = title
+        self.parent_id = parent_id
+        self.children: List["FolderNode"] = []
+
+    def __getitem__(self, key: str):
+        # Allow nodes to be used wherever a folders row was used before
+        return getattr(self, key)
+
+class FolderTree:
+    """Notebook hierarchy built from a single scan of the folders table."""
+
+    def __init__(self, rows: List[sqlite3.Row]):
+        self.nodes: Dict[str, FolderNode] = {}
+        self.roots: List[FolderNode] = []
+
+        # Rows arrive ordered by title, so children lists stay sorted
+        for row in rows:
+            self.nodes[row["id"]] = FolderNode(row["id"], row["title"], row["parent_id"] or "")
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_id) if node.parent_id else None
+            if parent:
+                parent.children.append(node)
+            elif not node.parent_id:
+                self.roots.append(node)
+
+    def get(self, folder_id: Optional[str]) -> Optional[FolderNode]:
+        return self.nodes.get(folder_id) if folder_id else None
+
+    def children(self, parent_id: Optional[str] = None) -> List[FolderNode]:
+        """Return the sub-folders of a folder, or the root notebooks for None."""
+        if not parent_id:
+            return self.roots
+        node = self.nodes.get(parent_id)
+        return node.children if node else []
+
+    def ancestors(self, folder_id: Optional[str]) -> List[FolderNode]:
+        """Return the chain of folders from the root down to folder_id."""
+        chain = []
+        seen = set()
+        node = self.get(folder_id)
+        while node and node.id not in seen:
+            seen.add(node.id)
+            chain.append(node)
+            node = self.get(node.parent_id)
+        chain.reverse()
+        return chain
+
+    def path(self, folder_id: Optional[str], sep: str = "/") -> str:
+        return sep.join(node.title for node in self.ancestors(folder_id))
+
+    def walk(self, folder_id: str):
+        """Yield a folder and all of its descendants, depth first."""
+        node = self.nodes.get(folder_id)
+        if not node:
+            return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+# ----------------------------------------------------------------------
+# Export filters
+# ----------------------------------------------------------------------
+def parse_time(value: str) -> int:
+    """
+    Parse a --since/--until value into Unix milliseconds: an ISO date or
+    date-time in local time (2024-07-01, 2024-07-01T09:30), or an age such
+    as 90d, 12w or 6h counted back from now.
+    """
+    match = re.fullmatch(r"(\d+)([hdw])", value.strip().lower())
+    if match:
+        hours = int(match.group(1)) * {"h": 1, "d": 24, "w": 24 * 7}[match.group(2)]
+        return int((time.time() - hours * 3600) * 1000)
+    try:
+        return int(datetime.fromisoformat(value.strip()).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"invalid date {value!r} (use YYYY-MM-DD, YYYY-MM-DDTHH:MM or an age like 90d)")
+
+class NoteFilter:
+    """
+    Restricts an export to the notes matching every given condition.
+
+    The filter is compiled into the WHERE clause of the export queries (see
+    JoplinDB.filter_sql), so notes that do not match are never read.
+    """
+
+    TODO_STATES = ("any", "open", "done")
+
+    def __init__(self, tags: Optional[List[str]] = None, since: Optional[str] = None, until: Optional[str] = None, todo: Optional[str] = None, query: Optional[str] = None):
+        """
+        Args:
+            tags: Tags every note must carry (case-insensitive)
+            since: Only notes updated at or after this time (see parse_time)
+            until: Only notes updated before this time
+            todo: Only to-dos: "any", "open" (not completed) or "done"
+            query: Only notes matching this full-text search (as with `s`)
+
+        Raises:
+            ValueError: For unparseable times, an empty time range or a
+                query without any word to search for
+        """
+        self.tags = list(tags or [])
+        self.since = since
+        self.until = until
+        self.todo = todo
+        self.query = query
+        self.since_ms = parse_time(since) if since else None
+        self.until_ms = parse_time(until) if until else None
+        if self.since_ms is not None and self.until_ms is not None and self.since_ms >= self.until_ms:
+            raise ValueError("--since must be earlier than --until")
+        # Search syntax alone (`***`, `()`) would silently match nothing
+        if query is not None and not re.search(r"\w", query):
+            raise ValueError(f"--query {query!r} has no words to search for")
+
+    def __bool__(self) -> bool:
+        return bool(self.tags or self.since or self.until or self.todo or self.query)
+
+    def options(self) -> Dict[str, Any]:
+        """The filter as given (recorded in export journals, so --resume needs the same filter)."""
+        return {"tags": self.tags, "since": self.since, "until": self.until, "todo": self.todo, "query": self.query}
+
+    def describe(self) -> str:
+        parts = [f"tag {tag}" for tag in self.tags]
+        if self.since:
+            parts.append(f"updated since {ts_to_str(self.since_ms)}")
+        if self.until:
+            parts.append(f"updated before {ts_to_str(self.until_ms)}")
+        if self.todo:
+            parts.append("to-dos" if self.todo == "any" else f"{self.todo} to-dos")
+        if self.query:
+            parts.append(f"matching {self.query!r}")
+        return ", ".join(parts)
+
 # ----------------------------------------------------------------------
 # Database wrapper
 # ----------------------------------------------------------------------
 class JoplinDB:
-    def __init__(self, db_path: str):
+    # Maximum number of bound parameters used in a single IN (...) query
+    MAX_PARAMS = 900
+
+    # Columns needed for listings; bodies are only loaded on demand
+    NOTE_SUMMARY_COLUMNS = ("id", "title", "parent_id", "created_time", "updated_time", "is_todo")
+    FOLDER_COLUMNS = "id, title, parent_id, created_time, updated_time"
+
+    # Connection tuning defaults (bytes)
+    DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+    DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, db_path: str, read_only: bool = False, immutable: bool = False,
+                 mmap_size: int = DEFAULT_MMAP_SIZE, cache_size: int = DEFAULT_CACHE_SIZE,
+                 resources_dir: Optional[str] = None):
+        """
+        Open a Joplin database.
+
+        Args:
+            db_path: Path to database.sqlite
+            read_only: Open with mode=ro and PRAGMA query_only, so the shell
+                can never take a write lock next to a running Joplin desktop
+            immutable: Treat the file as a snapshot that nothing else modifies
+                (skips locking and change detection entirely; implies read_only)
+            mmap_size: Bytes of the file to memory-map (0 disables mmap)
+            cache_size: Page cache size in bytes
+            resources_dir: Directory holding attachment files
+                (default: the resources/ directory next to db_path)
+        """
         if not Path(db_path).exists():
             raise FileNotFoundError(f"Database not found: {db_path}")
-        self.conn = sqlite3.connect(db_path)
+        read_only = read_only or immutable
+        self.read_only = read_only
+        uri = Path(db_path).resolve().as_uri()
+        if read_only:
+            uri += "?mode=ro"
+            if immutable:
+                uri += "&immutable=1"
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self._snapshot_file: Optional[str] = None
+        self.resource_store = ResourceStore(Path(resources_dir) if resources_dir else Path(db_path).resolve().parent / "resources")
+        self._attach(sqlite3.connect(uri, uri=True))
+
+        # octet_length() reads the size from the record header without
+        # touching overflow pages, but only exists in SQLite 3.43+
+        self._has_octet_length = sqlite3.sqlite_version_info >= (3, 43, 0)
+
+    def _attach(self, conn: sqlite3.Connection):
+        """Configure a connection and make it the one all queries run against."""
+        self.conn = conn
         self.conn.row_factory = sqlite3.Row
         self.cur = self.conn.cursor()
 
+        self.cur.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        # A negative cache_size is interpreted by SQLite as KiB rather than pages
+        self.cur.execute(f"PRAGMA cache_size = {-(int(self.cache_size) // 1024)}")
+        self.cur.execute("PRAGMA temp_store = MEMORY")
+        if self.read_only:
+            self.cur.execute("PRAGMA query_only = ON")
+        self.conn.create_function("joplin_bm25", -1, bm25_from_matchinfo)
+
+        self._folder_tree: Optional[FolderTree] = None
+        self._folder_tree_version: Optional[int] = None
+        self._fts_info: Optional[Tuple[Optional[str], List[str]]] = None
+        self._fts_matches: Dict[str, str] = {}
+
+    def snapshot(self, target: str = "memory", pages: int = 1024, progress=None):
+        """
+        Copy the database into a private snapshot and switch to it.
+
+        Uses the SQLite online backup API, copying `pages` pages per step and
+        releasing the read lock in between, so a running Joplin can keep
+        writing. If Joplin commits mid-copy SQLite restarts the backup, which
+        guarantees the snapshot reflects a single consistent state.
+
+        Args:
+            target: "memory" for an in-memory copy, "temp" for a temporary file
+            pages: Pages copied per backup step
+            progress: Optional callback(status, remaining, total) from sqlite3
+        """
+        if target == "memory":
+            dest = sqlite3.connect(":memory:")
+        elif target == "temp":
+            fd, self._snapshot_file = tempfile.mkstemp(prefix="joplin-snapshot-", suffix=".sqlite")
+            os.close(fd)
+            dest = sqlite3.connect(self._snapshot_file)
+        else:
+            raise ValueError(f"Unknown snapshot target: {target}")
+
+        self.conn.backup(dest, pages=pages, sleep=0.005, progress=progress)
+        self.conn.close()
+        # The copy is private, so it is always treated as read-only
+        self.read_only = True
+        self._attach(dest)
+
     # ------------------------------------------------------------------
     # Low-level helpers
     # ------------------------------------------------------------------
@@ -232,285 +520,2906 @@ class JoplinDB:
         self.cur.execute(sql, params)
         return self.cur.fetchall()
 
+    def _summary_columns(self, alias: str = "") -> str:
+        """Build the SELECT list for note summaries (no body)."""
+        prefix = f"{alias}." if alias else ""
+        cols = [prefix + c for c in self.NOTE_SUMMARY_COLUMNS]
+        if self._has_octet_length:
+            cols.append(f"octet_length({prefix}body) AS size")
+        else:
+            # Any fallback would read every body, which summaries exist to avoid
+            cols.append("NULL AS size")
+        return ", ".join(cols)
+
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
     def get_folders(self, parent_id: Optional[str] = None) -> List[sqlite3.Row]:
         if parent_id is None:
             # Handle root folders - Joplin uses empty string as root marker
-            sql = "SELECT * FROM folders WHERE parent_id = '' ORDER BY title"
+            sql = f"SELECT {self.FOLDER_COLUMNS} FROM folders WHERE parent_id = '' ORDER BY title"
             return self._exec(sql)
         else:
-            sql = "SELECT * FROM folders WHERE parent_id = ? ORDER BY title"
-            return self._exec(sql, (parent_id,))
+            sql = f"SELECT {self.FOLDER_COLUMNS} FROM folders WHERE parent_id = ? ORDER BY title"
+            return self._exec(sql, (parent_id,))
+
+    def get_all_folders(self) -> List[sqlite3.Row]:
+        """Get all folders (including subfolders)."""
+        return self._exec(f"SELECT {self.FOLDER_COLUMNS} FROM folders ORDER BY title")
+
+    def folder_tree(self) -> FolderTree:
+        """
+        Return the cached folder tree, rebuilding it only when the database
+        has been changed by another connection (e.g. a Joplin sync).
+        """
+        version = self._exec("PRAGMA data_version")[0][0]
+        if self._folder_tree is None or version != self._folder_tree_version:
+            rows = self._exec("SELECT id, title, parent_id FROM folders ORDER BY title")
+            self._folder_tree = FolderTree(rows)
+            self._folder_tree_version = version
+        return self._folder_tree
+
+    def get_folder_note_counts(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Count notes per folder with a single GROUP BY query.
+
+        Returns:
+            Dict mapping folder IDs to (direct notes, notes in whole subtree)
+        """
+        rows = self._exec("SELECT parent_id, COUNT(*) AS n FROM notes GROUP BY parent_id")
+        direct = {row["parent_id"]: row["n"] for row in rows}
+
+        # Aggregate bottom-up: children always follow their parent in a
+        # depth-first walk, so summing in reverse order visits leaves first
+        tree = self.folder_tree()
+        order = []
+        for node in tree.nodes.values():
+            if node.parent_id not in tree.nodes:
+                order.extend(tree.walk(node.id))
+        counts = {fid: (direct.get(fid, 0), direct.get(fid, 0)) for fid in tree.nodes}
+        for node in reversed(order):
+            subtree = direct.get(node.id, 0) + sum(counts[c.id][1] for c in node.children)
+            counts[node.id] = (direct.get(node.id, 0), subtree)
+        return counts
+
+    def get_note(self, note_id: str) -> Optional[sqlite3.Row]:
+        rows = self._exec("SELECT * FROM notes WHERE id = ?", (note_id,))
+        return rows[0] if rows else None
+
+    def get_note_body(self, note_id: str) -> Optional[str]:
+        rows = self._exec("SELECT body FROM notes WHERE id = ?", (note_id,))
+        return rows[0]["body"] if rows else None
+
+    def get_notes_in_folder(self, folder_id: str) -> List[sqlite3.Row]:
+        return self._exec(
+            "SELECT * FROM notes WHERE parent_id = ? ORDER BY title, id", (folder_id,)
+        )
+
+    def get_note_summaries_in_folder(self, folder_id: str) -> List[sqlite3.Row]:
+        """List the notes in a folder without loading their bodies."""
+        return self._exec(
+            f"SELECT {self._summary_columns()} FROM notes WHERE parent_id = ? ORDER BY title",
+            (folder_id,),
+        )
+
+    def find_by_id_prefix(self, table: str, prefix: str, parent_id: Optional[str] = None, limit: int = 2) -> List[sqlite3.Row]:
+        """
+        Resolve a (case-insensitive) ID prefix with a range scan on the primary key.
+
+        Args:
+            table: "notes" or "folders"
+            prefix: Leading characters of the ID
+            parent_id: Only match items inside this folder ('' for root level)
+            limit: Maximum number of matches to return; 2 is enough to detect ambiguity
+
+        Returns:
+            Up to `limit` matching rows, ordered by ID (note rows are summaries)
+        """
+        if table == "notes":
+            columns = self._summary_columns()
+        elif table == "folders":
+            columns = self.FOLDER_COLUMNS
+        else:
+            raise ValueError(f"Unsupported table: {table}")
+
+        # Joplin IDs are lowercase hex, so [prefix, prefix-with-last-char-bumped)
+        # covers exactly the IDs starting with prefix
+        low = prefix.strip().lower()
+        if not low:
+            return []
+        high = low[:-1] + chr(ord(low[-1]) + 1)
+
+        sql = f"SELECT {columns} FROM {table} WHERE id >= ? AND id < ?"
+        params: List[Any] = [low, high]
+        if parent_id is not None:
+            sql += " AND parent_id = ?"
+            params.append(parent_id)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return self._exec(sql, params)
+
+    def get_tags_for_note(self, note_id: str) -> List[str]:
+        sql = """
+            SELECT t.title
+            FROM tags t
+            JOIN note_tags nt ON t.id = nt.tag_id
+            WHERE nt.note_id = ?
+            ORDER BY t.title
+        """
+        return [row["title"] for row in self._exec(sql, (note_id,))]
+
+    def get_tags_for_notes(self, note_ids: List[str]) -> Dict[str, List[str]]:
+        """
+        Fetch tags for many notes at once.
+
+        Args:
+            note_ids: IDs of the notes to look up
+
+        Returns:
+            Dict mapping note IDs to their sorted tag titles (notes without tags are omitted)
+        """
+        tags: Dict[str, List[str]] = {}
+        ids = list(note_ids)
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), self.MAX_PARAMS):
+            chunk = ids[start:start + self.MAX_PARAMS]
+            sql = f"""
+                SELECT nt.note_id, t.title
+                FROM note_tags nt
+                JOIN tags t ON t.id = nt.tag_id
+                WHERE nt.note_id IN ({",".join("?" * len(chunk))})
+                ORDER BY t.title
+            """
+            for row in self._exec(sql, chunk):
+                tags.setdefault(row["note_id"], []).append(row["title"])
+        return tags
+
+    def get_resource_ids_for_notes(self, note_ids: List[str]) -> Dict[str, List[str]]:
+        """Fetch the linked resource IDs of many notes at once (notes without resources are omitted)."""
+        resource_ids: Dict[str, List[str]] = {}
+        ids = list(note_ids)
+        for start in range(0, len(ids), self.MAX_PARAMS):
+            chunk = ids[start:start + self.MAX_PARAMS]
+            sql = f"""
+                SELECT note_id, resource_id
+                FROM note_resources
+                WHERE note_id IN ({",".join("?" * len(chunk))})
+                ORDER BY resource_id
+            """
+            for row in self._exec(sql, chunk):
+                resource_ids.setdefault(row["note_id"], []).append(row["resource_id"])
+        return resource_ids
+
+    def get_note_ids_in_folders(self, note_ids: List[str], folder_ids: set) -> set:
+        """Return which of these notes still exist and live in one of these folders."""
+        found = set()
+        ids = list(note_ids)
+        for start in range(0, len(ids), self.MAX_PARAMS):
+            chunk = ids[start:start + self.MAX_PARAMS]
+            sql = f"SELECT id, parent_id FROM notes WHERE id IN ({','.join('?' * len(chunk))})"
+            found.update(row["id"] for row in self._exec(sql, chunk) if row["parent_id"] in folder_ids)
+        return found
+
+    def get_tags_for_folder(self, folder_id: str) -> Dict[str, List[str]]:
+        """Fetch tags for every note directly inside a folder in one query."""
+        sql = """
+            SELECT nt.note_id, t.title
+            FROM notes n
+            JOIN note_tags nt ON nt.note_id = n.id
+            JOIN tags t ON t.id = nt.tag_id
+            WHERE n.parent_id = ?
+            ORDER BY t.title
+        """
+        tags: Dict[str, List[str]] = {}
+        for row in self._exec(sql, (folder_id,)):
+            tags.setdefault(row["note_id"], []).append(row["title"])
+        return tags
+
+    def iter_tags_with_counts(self):
+        """Stream every tag with the number of notes carrying it, ordered by title."""
+        sql = """
+            SELECT t.id, t.title, t.created_time, t.updated_time, count(nt.note_id) AS notes
+            FROM tags t
+            LEFT JOIN note_tags nt ON nt.tag_id = t.id
+            GROUP BY t.id
+            ORDER BY t.title COLLATE NOCASE, t.id
+        """
+        cursor = self.conn.execute(sql)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def get_resources_for_note(self, note_id: str) -> List[sqlite3.Row]:
+        sql = """
+            SELECT r.*
+            FROM resources r
+            JOIN note_resources nr ON r.id = nr.resource_id
+            WHERE nr.note_id = ?
+            ORDER BY r.title
+        """
+        return self._exec(sql, (note_id,))
+
+    def get_resource(self, resource_id: str) -> Optional[sqlite3.Row]:
+        rows = self._exec("SELECT * FROM resources WHERE id = ?", (resource_id,))
+        return rows[0] if rows else None
+
+    # ------------------------------------------------------------------
+    # Bulk export queries
+    # ------------------------------------------------------------------
+    # Folder IDs of a notebook and all of its descendants (UNION stops cycles)
+    SUBTREE_CTE = """
+        WITH RECURSIVE subtree(id) AS (
+            SELECT :folder_id
+            UNION
+            SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+        )
+    """
+    # Separator for group_concat'ed tag titles (ASCII unit separator)
+    LIST_SEPARATOR = "\x1f"
+
+    def iter_note_summaries_in_subtree(self, folder_id: str, note_filter: Optional[NoteFilter] = None):
+        """Stream body-less summaries of every (matching) note below a folder, grouped by folder and ordered by title."""
+        conditions, params = self.filter_sql(note_filter)
+        sql = f"""
+            {self.SUBTREE_CTE}
+            SELECT {self._summary_columns("n")}
+            FROM notes n
+            WHERE n.parent_id IN subtree{conditions}
+            ORDER BY n.parent_id, n.title, n.id
+        """
+        cursor = self.conn.execute(sql, {"folder_id": folder_id, **params})
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def iter_notes_for_export(self, folder_id: str, by_title: bool = False, note_filter: Optional[NoteFilter] = None):
+        """
+        Stream every note below a folder, with its tags and resource IDs, from one cursor.
+
+        Tags and resource links of the notes below the folder are
+        pre-aggregated per note with GROUP BY and joined in, so each row
+        carries `tag_titles` and `resource_ids` (LIST_SEPARATOR-joined, or
+        NULL). Rows come in storage order, which avoids sorting whole bodies
+        and keeps memory flat.
+
+        With by_title, only the folder's own notes are streamed, in title
+        order (for writing a whole notebook into one file); their tags and
+        resources are then looked up per note through the note_id indexes.
+        Only notes matching note_filter are read.
+        """
+        conditions, params = self.filter_sql(note_filter)
+        if by_title:
+            sql = f"""
+                SELECT n.*,
+                       (SELECT group_concat(t.title, :sep)
+                        FROM note_tags nt
+                        JOIN tags t ON t.id = nt.tag_id
+                        WHERE nt.note_id = n.id) AS tag_titles,
+                       (SELECT group_concat(nr.resource_id, :sep)
+                        FROM note_resources nr
+                        WHERE nr.note_id = n.id) AS resource_ids
+                FROM notes n
+                WHERE n.parent_id = :folder_id{conditions}
+                ORDER BY n.title, n.id
+            """
+        else:
+            sql = f"""
+                {self.SUBTREE_CTE}
+                SELECT n.*, tg.tag_titles, nr.resource_ids
+                FROM notes n
+                LEFT JOIN (
+                    SELECT nt.note_id, group_concat(t.title, :sep) AS tag_titles
+                    FROM note_tags nt
+                    JOIN tags t ON t.id = nt.tag_id
+                    WHERE nt.note_id IN (SELECT id FROM notes WHERE parent_id IN subtree)
+                    GROUP BY nt.note_id
+                ) tg ON tg.note_id = n.id
+                LEFT JOIN (
+                    SELECT note_id, group_concat(resource_id, :sep) AS resource_ids
+                    FROM note_resources
+                    WHERE note_id IN (SELECT id FROM notes WHERE parent_id IN subtree)
+                    GROUP BY note_id
+                ) nr ON nr.note_id = n.id
+                WHERE n.parent_id IN subtree{conditions}
+            """
+        cursor = self.conn.execute(sql, {"folder_id": folder_id, "sep": self.LIST_SEPARATOR, **params})
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def get_export_totals(self, folder_ids: List[str], note_filter: Optional[NoteFilter] = None) -> Dict[str, int]:
+        """
+        Size up an export of these notebooks (and their sub-notebooks) in one aggregate query.
+        Only notes matching note_filter are counted.
+
+        Returns:
+            Dict with "notes", "bytes" (note bodies), "attachments" and
+            "attachment_bytes" (from resources.size; unknown sizes count as 0)
+        """
+        if not folder_ids:
+            return {"notes": 0, "bytes": 0, "attachments": 0, "attachment_bytes": 0}
+        body_size = "octet_length(n.body)" if self._has_octet_length else "length(n.body)"
+        conditions, params = self.filter_sql(note_filter)
+        params.update((f"folder{i}", folder_id) for i, folder_id in enumerate(folder_ids))
+        placeholders = ",".join(f":folder{i}" for i in range(len(folder_ids)))
+        sql = f"""
+            WITH RECURSIVE subtree(id) AS (
+                SELECT id FROM folders WHERE id IN ({placeholders})
+                UNION
+                SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+            ),
+            exported AS (SELECT n.id, {body_size} AS size FROM notes n WHERE n.parent_id IN subtree{conditions}),
+            linked AS (
+                SELECT r.size FROM note_resources nr
+                JOIN exported n ON n.id = nr.note_id
+                JOIN resources r ON r.id = nr.resource_id
+            )
+            SELECT
+                (SELECT count(*) FROM exported) AS notes,
+                (SELECT coalesce(sum(size), 0) FROM exported) AS bytes,
+                (SELECT count(*) FROM linked) AS attachments,
+                (SELECT coalesce(sum(max(size, 0)), 0) FROM linked) AS attachment_bytes
+        """
+        return dict(self._exec(sql, params)[0])
+
+    # Tables exported as raw Joplin items, with their item type (BaseModel.TYPE_*)
+    ITEM_TYPES = {"folders": 2, "tags": 5, "notes": 1, "note_tags": 6, "resources": 4}
+
+    def get_item_totals(self) -> Dict[str, int]:
+        """Count notes and resources (and resource bytes) for a raw export, in one query."""
+        sql = """
+            SELECT
+                (SELECT count(*) FROM notes) AS notes,
+                (SELECT count(*) FROM resources) AS attachments,
+                (SELECT coalesce(sum(max(size, 0)), 0) FROM resources) AS attachment_bytes
+        """
+        return dict(self._exec(sql)[0])
+
+    def iter_items(self, table: str):
+        """Stream every row of one of the ITEM_TYPES tables, all columns, from a dedicated cursor."""
+        if table not in self.ITEM_TYPES:
+            raise ValueError(f"not an item table: {table}")
+        cursor = self.conn.execute(f"SELECT * FROM {table}")
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def get_resources_by_id(self) -> Dict[str, sqlite3.Row]:
+        """Load metadata of every resource (not the file contents) keyed by ID."""
+        return {row["id"]: row for row in self._exec("SELECT * FROM resources")}
+
+    # Relative weight of each notes_fts column when ranking search results
+    FTS_WEIGHTS = {"title": 10.0, "body": 1.0}
+    SNIPPET_TOKENS = 12
+
+    def _fts(self) -> Tuple[Optional[str], List[str]]:
+        """Detect the notes_fts module ("fts4", "fts5" or None) and its columns."""
+        if self._fts_info is None:
+            rows = self._exec("SELECT sql FROM sqlite_master WHERE name = 'notes_fts'")
+            sql = (rows[0]["sql"] or "").lower() if rows else ""
+            module = "fts5" if "fts5" in sql else "fts4" if ("fts4" in sql or "fts3" in sql) else None
+            columns = [r["name"] for r in self._exec("PRAGMA table_info(notes_fts)")] if module else []
+            self._fts_info = (module, columns)
+        return self._fts_info
+
+    @staticmethod
+    def _fts_query(term: str, raw: bool = True) -> str:
+        """
+        Turn user input into an FTS MATCH expression.
+
+        Plain words become quoted prefix queries ("fit" matches "fitness"),
+        while input that already uses FTS syntax is passed through unchanged.
+        """
+        if raw and re.search(r'["*()]|\b(AND|OR|NOT|NEAR)\b', term):
+            return term
+        words = re.findall(r"\w+", term)
+        return " ".join(f'"{w}"*' for w in words)
+
+    @staticmethod
+    def _like_pattern(term: str) -> str:
+        """A LIKE pattern (used with ESCAPE '\\') matching term literally anywhere in a value."""
+        return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+    def filter_sql(self, note_filter: Optional[NoteFilter], alias: str = "n") -> Tuple[str, Dict[str, Any]]:
+        """
+        Compile an export filter into conditions on the notes table (aliased
+        `alias`) to append to a WHERE clause, and their named parameters.
+
+        Returns:
+            (" AND ..." conditions, or "" without a filter; parameters)
+
+        Raises:
+            ValueError: When the full-text query contains nothing to search for
+        """
+        if not note_filter:
+            return "", {}
+        conditions: List[str] = []
+        params: Dict[str, Any] = {}
+        for i, tag in enumerate(note_filter.tags):
+            conditions.append(f"""{alias}.id IN (
+                SELECT nt.note_id FROM note_tags nt JOIN tags t ON t.id = nt.tag_id
+                WHERE t.title = :filter_tag{i} COLLATE NOCASE)""")
+            params[f"filter_tag{i}"] = tag
+        if note_filter.since_ms is not None:
+            conditions.append(f"{alias}.updated_time >= :filter_since")
+            params["filter_since"] = note_filter.since_ms
+        if note_filter.until_ms is not None:
+            conditions.append(f"{alias}.updated_time < :filter_until")
+            params["filter_until"] = note_filter.until_ms
+        if note_filter.todo:
+            conditions.append(f"{alias}.is_todo = 1")
+            if note_filter.todo == "open":
+                conditions.append(f"{alias}.todo_completed = 0")
+            elif note_filter.todo == "done":
+                conditions.append(f"{alias}.todo_completed != 0")
+        if note_filter.query:
+            if self._fts()[0]:
+                conditions.append(f"{alias}.rowid IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH :filter_query)")
+                params["filter_query"] = self._fts_match(note_filter.query)
+            else:
+                conditions.append(f"({alias}.title LIKE :filter_like ESCAPE '\\' OR {alias}.body LIKE :filter_like ESCAPE '\\')")
+                params["filter_like"] = self._like_pattern(note_filter.query)
+        return "".join(f" AND {condition}" for condition in conditions), params
+
+    def _fts_match(self, term: str) -> str:
+        """The MATCH expression for a search term, with the words quoted when its FTS syntax is malformed."""
+        if term not in self._fts_matches:
+            match = self._fts_query(term)
+            try:
+                self.conn.execute("SELECT 1 FROM notes_fts WHERE notes_fts MATCH ? LIMIT 1", (match,)).fetchall()
+            except sqlite3.OperationalError:
+                match = self._fts_query(term, raw=False)
+            if not match:
+                raise ValueError(f"nothing to search for in {term!r}")
+            self._fts_matches[term] = match
+        return self._fts_matches[term]
+
+    def search_notes(self, term: str, limit: int = 50) -> List[sqlite3.Row]:
+        """Return the best `limit` matches for a search term."""
+        return list(self.iter_search_notes(term, limit=limit))
+
+    def iter_search_notes(self, term: str, limit: Optional[int] = None, after: Optional[Tuple[float, str]] = None, offset: int = 0):
+        """
+        Stream search results, best matches first, straight from the cursor.
+
+        Results are ranked with BM25 (title weighted above body) and carry a
+        `snippet` column with the matching context plus a `score` column.
+        Only the requested page is ranked and limited in an inner query, so
+        snippets are built for the rows returned rather than for every hit.
+        A LIKE scan is only used when the database has no usable notes_fts
+        table.
+
+        Args:
+            term: Search term (plain words or FTS query syntax)
+            limit: Maximum number of rows to yield (None for all)
+            after: (score, id) keyset cursor of the last row already seen
+            offset: Number of rows to skip (used to jump to a page)
+        """
+        params: Dict[str, Any] = {"limit": -1 if limit is None else limit, "offset": offset}
+        module, columns = self._fts()
+        if module:
+            weights = [self.FTS_WEIGHTS.get(c, 0.0) for c in columns]
+            weight_args = ", ".join(str(w) for w in weights)
+            if module == "fts5":
+                score = f"bm25(notes_fts, {weight_args})"
+                snippet = f"snippet(notes_fts, -1, '*', '*', '…', {self.SNIPPET_TOKENS})"
+            else:
+                score = f"joplin_bm25(matchinfo(notes_fts, 'pcnalx'), {weight_args})"
+                snippet = f"snippet(notes_fts, '*', '*', '…', -1, {self.SNIPPET_TOKENS})"
+            where = "notes_fts MATCH :query"
+            from_clause = "notes_fts JOIN notes n ON notes_fts.rowid = n.rowid"
+            # snippet() needs the MATCH cursor; CROSS JOIN keeps it the outer
+            # loop and only reads the notes on the page
+            page_join = ("notes_fts CROSS JOIN page ON page.note_rowid = notes_fts.rowid "
+                         "CROSS JOIN notes n ON n.rowid = page.note_rowid WHERE notes_fts MATCH :query")
+            params["query"] = self._fts_query(term)
+            if not params["query"]:
+                return
+        else:
+            # No full-text index: scan titles and bodies, title matches first
+            score = "CASE WHEN n.title LIKE :term ESCAPE '\\' THEN 0 ELSE 1 END"
+            snippet = "substr(n.body, max(1, instr(LOWER(n.body), LOWER(:raw)) - 40), 100)"
+            where = "(n.title LIKE :term ESCAPE '\\' OR n.body LIKE :term ESCAPE '\\')"
+            from_clause = "notes n"
+            page_join = "page JOIN notes n ON n.rowid = page.note_rowid"
+            params.update(term=self._like_pattern(term), raw=term)
+
+        if after is not None:
+            # Keyset pagination: continue strictly after the last (score, id) seen
+            where += f" AND ({score}, n.id) > (:after_score, :after_id)"
+            params.update(after_score=after[0], after_id=after[1])
+
+        sql = f"""
+            WITH page AS (
+                SELECT n.rowid AS note_rowid, {score} AS score
+                FROM {from_clause}
+                WHERE {where}
+                ORDER BY score, n.id
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT {self._summary_columns("n")}, n.parent_id as notebook_id,
+                   page.score AS score, {snippet} AS snippet
+            FROM {page_join}
+            ORDER BY page.score, n.id
+        """
+        # A dedicated cursor lets callers consume rows lazily while other
+        # queries run on self.cur
+        try:
+            cursor = self.conn.execute(sql, params)
+        except sqlite3.OperationalError:
+            if not module:
+                raise
+            # Malformed FTS syntax: retry with the words quoted
+            fallback_query = self._fts_query(term, raw=False)
+            if not fallback_query or fallback_query == params["query"]:
+                return
+            params["query"] = fallback_query
+            cursor = self.conn.execute(sql, params)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+        if self._snapshot_file:
+            os.unlink(self._snapshot_file)
+            self._snapshot_file = None
+
+# ----------------------------------------------------------------------
+# Resource files
+# ----------------------------------------------------------------------
+# Chunk size for copies that cannot be done in the kernel
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+def copy_file(source: Path, dest: Path) -> int:
+    """
+    Copy a file without buffering it in Python.
+
+    Tries os.copy_file_range (in-kernel, and server-side on NFS/SMB), then
+    os.sendfile, and finally falls back to a chunked copy, so even
+    multi-GB attachments never have to fit in memory.
+
+    Returns:
+        Number of bytes copied
+    """
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        copied = 0
+        for method in ("copy_file_range", "sendfile"):
+            fn = getattr(os, method, None)
+            if fn is None:
+                continue
+            try:
+                while copied < size:
+                    if method == "copy_file_range":
+                        n = fn(src.fileno(), dst.fileno(), min(size - copied, COPY_CHUNK_SIZE * 16))
+                    else:
+                        n = fn(dst.fileno(), src.fileno(), copied, min(size - copied, COPY_CHUNK_SIZE * 16))
+                    if n == 0:
+                        break
+                    copied += n
+                if copied >= size:
+                    return copied
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF):
+                    raise
+            # Restart from wherever the previous method stopped
+            src.seek(copied)
+            dst.seek(copied)
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        return dst.tell()
+
+# ioctl request that clones a file's extents (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Ways an attachment can be placed in an export
+ATTACHMENT_MODES = ("copy", "reflink", "hardlink", "symlink")
+
+def partial_path(path: Path) -> Path:
+    """Hidden temporary name a file is written under before being renamed into place."""
+    return path.with_name(f".{path.name}.part")
+
+def place_file(source: Path, dest: Path, mode: str = "copy") -> str:
+    """
+    Put a copy of source at dest using the cheapest available method.
+
+    The file is created under partial_path(dest) and renamed over dest once
+    complete, so an interrupted export never leaves a truncated file behind.
+
+    Args:
+        source: Existing file
+        dest: Path to create (replaced if it exists)
+        mode: "reflink" (copy-on-write clone via FICLONE), "hardlink",
+            "symlink" or "copy"; any method the filesystem or platform does
+            not support falls back to a regular copy
+
+    Returns:
+        The method that was actually used
+    """
+    tmp_path = partial_path(dest)
+    if tmp_path.exists() or tmp_path.is_symlink():
+        tmp_path.unlink()
+    used = "copy"
+    try:
+        if mode == "reflink":
+            import fcntl
+            with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            used = mode
+        elif mode == "hardlink":
+            os.link(source, tmp_path)
+            used = mode
+        elif mode == "symlink":
+            os.symlink(source.resolve(), tmp_path)
+            used = mode
+    except (ImportError, OSError, NotImplementedError):
+        # Unsupported here (other filesystem, no privileges, ...): copy instead
+        pass
+    try:
+        if used == "copy":
+            copy_file(source, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        # Never leave a partial file behind (disk full, I/O error, Ctrl-C)
+        if tmp_path.exists() or tmp_path.is_symlink():
+            tmp_path.unlink()
+        raise
+    if used == "hardlink" and tmp_path.exists():
+        # rename() is a no-op when dest is already a link to the same file
+        tmp_path.unlink()
+    return used
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file, read in chunks so it never has to fit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def copy_and_hash(source: Path, dest: Path) -> str:
+    """Copy a file in chunks and return its SHA-256, reading the source only once."""
+    digest = hashlib.sha256()
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+class ResourceStore:
+    """
+    Locates attachment files in a Joplin profile.
+
+    Joplin keeps resource contents outside the database, as
+    `resources/<id>.<file_extension>` next to database.sqlite.
+    """
+
+    def __init__(self, resources_dir: Path):
+        self.resources_dir = resources_dir
+        # Resource ID -> first file name with that ID, listed on first miss
+        self._by_id: Optional[Dict[str, str]] = None
+
+    def path_for(self, resource: sqlite3.Row) -> Optional[Path]:
+        """Return the file holding a resource's contents, or None if it is missing."""
+        extension = resource["file_extension"]
+        path = self.resources_dir / (f"{resource['id']}.{extension}" if extension else resource["id"])
+        if path.is_file():
+            return path
+        # Older profiles may have a different extension than the one recorded
+        name = self._listing().get(resource["id"])
+        return self.resources_dir / name if name else None
+
+    def _listing(self) -> Dict[str, str]:
+        """Index the resources directory once, instead of globbing it for every missing file."""
+        if self._by_id is None:
+            by_id: Dict[str, str] = {}
+            try:
+                names = sorted(os.listdir(self.resources_dir))
+            except OSError:
+                names = []
+            for name in names:
+                stem, dot, _ = name.partition(".")
+                if dot:
+                    by_id.setdefault(stem, name)
+            self._by_id = by_id
+        return self._by_id
+
+# ----------------------------------------------------------------------
+# Export sinks
+# ----------------------------------------------------------------------
+class DirectorySink:
+    """
+    Writes an export as regular files (the default).
+
+    Writes are atomic (temporary name, then rename) and safe to call from
+    worker threads, so notes are written as soon as they are rendered.
+    """
+
+    concurrent = True
+
+    def makedirs(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+
+    def exists(self, path: Path) -> bool:
+        return path.exists()
+
+    def write(self, path: Path, data: bytes, mtime: Optional[float] = None):
+        tmp_path = partial_path(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            if mtime is not None:
+                os.utime(tmp_path, (mtime, mtime))
+            os.replace(tmp_path, path)
+        except BaseException:
+            # Never leave a partial file behind (disk full, I/O error, Ctrl-C)
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+
+    def add_file(self, source: Path, path: Path, mode: str = "copy") -> str:
+        return place_file(source, path, mode)
+
+    def close(self, complete: bool = True):
+        pass
+
+class ArchiveSink:
+    """
+    Streams an export into a single tar (plain, gzip or zstd) or zip archive.
+
+    Paths are archived relative to `root`. Entries are queued in export
+    order and a background thread writes and compresses them, so the
+    database reader only waits when the queue is full. Attachments are
+    streamed from the Joplin profile straight into the archive; nothing
+    else touches the disk. The target "-" writes to stdout.
+    """
+
+    concurrent = False
+    FORMATS = ("tar", "tar.gz", "tar.zst", "zip")
+    QUEUE_SIZE = 64
+
+    def __init__(self, target: str, archive_format: Optional[str] = None):
+        self.root = Path(".")
+        self.target = target
+        self.format = archive_format or self.format_for(target)
+        self.started = time.time()
+        self._names: set = set()
+        self._error: Optional[BaseException] = None
+        self._process = None
+        self._compressor = None
+
+        if target == "-":
+            self._out = sys.__stdout__.buffer
+        else:
+            self._out = open(target, "wb")
+        try:
+            self._archive = self._open_archive()
+        except BaseException:
+            self._discard()
+            raise
+        self._queue: "queue.Queue" = queue.Queue(self.QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="archive-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def format_for(cls, target: str) -> str:
+        """Pick the archive format from the file name (stdout gets a plain tar)."""
+        name = target.lower()
+        if name.endswith((".tar.gz", ".tgz")):
+            return "tar.gz"
+        if name.endswith((".tar.zst", ".tzst")):
+            return "tar.zst"
+        if name.endswith(".zip"):
+            return "zip"
+        if name == "-" or name.endswith(".tar"):
+            return "tar"
+        raise ValueError(f"cannot tell the archive format of {target} (use .tar, .tar.gz, .tar.zst or .zip)")
+
+    def _open_archive(self):
+        if self.format == "zip":
+            return zipfile.ZipFile(self._out, "w", compression=zipfile.ZIP_DEFLATED)
+        if self.format == "tar.gz":
+            return tarfile.open(fileobj=self._out, mode="w|gz", format=tarfile.PAX_FORMAT)
+        stream = self._out
+        if self.format == "tar.zst":
+            try:
+                import zstandard
+                self._compressor = zstandard.ZstdCompressor().stream_writer(self._out, closefd=False)
+                stream = self._compressor
+            except ImportError:
+                # Fall back to the zstd command line tool, compressing in its own process
+                import subprocess
+                zstd = shutil.which("zstd")
+                if not zstd:
+                    raise ValueError("zstd compression needs the zstandard package or the zstd command")
+                self._out.flush()
+                self._process = subprocess.Popen([zstd, "-q", "-c"], stdin=subprocess.PIPE, stdout=self._out)
+                stream = self._process.stdin
+        return tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def _name(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+    def _put(self, item: tuple):
+        if self._error:
+            raise self._error
+        self._queue.put(item)
+
+    def makedirs(self, path: Path):
+        for directory in reversed([path, *path.parents]):
+            if directory == self.root:
+                continue
+            name = self._name(directory)
+            if name not in self._names:
+                self._names.add(name)
+                self._put(("dir", name, None, self.started))
+
+    def exists(self, path: Path) -> bool:
+        return self._name(path) in self._names
+
+    def write(self, path: Path, data: bytes, mtime: Optional[float] = None):
+        # Note files are not remembered (exists() only serves directories
+        # and attachments), so memory does not grow with the number of notes
+        self._put(("data", self._name(path), data, mtime or self.started))
+
+    def add_file(self, source: Path, path: Path, mode: str = "copy") -> str:
+        name = self._name(path)
+        self._names.add(name)
+        self._put(("file", name, source, None))
+        return "copy"
+
+    def write_stream(self, path: Path, fileobj, mtime: Optional[float] = None):
+        """Archive the contents of a seekable file object, which the writer thread closes."""
+        self._put(("stream", self._name(path), fileobj, mtime or self.started))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error:
+                continue
+            try:
+                self._write_entry(*item)
+            except BaseException as e:
+                self._error = e
+
+    def _write_entry(self, kind: str, name: str, payload, mtime: Optional[float]):
+        if kind == "file":
+            with open(payload, "rb") as src:
+                st = os.fstat(src.fileno())
+                self._add(name, src, st.st_size, st.st_mtime)
+        elif kind == "data":
+            self._add(name, io.BytesIO(payload), len(payload), mtime)
+        elif kind == "stream":
+            with payload:
+                size = payload.seek(0, io.SEEK_END)
+                payload.seek(0)
+                self._add(name, payload, size, mtime)
+        elif self.format == "zip":
+            self._archive.writestr(self._zip_info(name + "/", mtime), b"")
+        else:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = int(mtime)
+            self._archive.addfile(info)
+            self._archive.members.clear()
+
+    def _add(self, name: str, fileobj, size: int, mtime: float):
+        if self.format == "zip":
+            info = self._zip_info(name, mtime)
+            info.file_size = size
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with self._archive.open(info, "w") as dst:
+                shutil.copyfileobj(fileobj, dst, COPY_CHUNK_SIZE)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mode = 0o644
+            info.mtime = int(mtime)
+            self._archive.addfile(info, fileobj)
+            # TarFile keeps every member it wrote; a streamed archive never needs them
+            self._archive.members.clear()
+
+    @staticmethod
+    def _zip_info(name: str, mtime: float) -> zipfile.ZipInfo:
+        # Zip timestamps cannot predate 1980
+        return zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])
+
+    def close(self, complete: bool = True):
+        """Finish the archive; an incomplete archive file is deleted."""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._archive.close()
+            if self._compressor:
+                self._compressor.close()
+            if self._process:
+                self._process.stdin.close()
+                if self._process.wait() != 0:
+                    raise OSError(f"zstd exited with status {self._process.returncode}")
+            self._out.flush()
+        except BaseException:
+            complete = False
+            raise
+        finally:
+            if self._error:
+                complete = False
+            if self.target != "-":
+                self._out.close()
+                if not complete:
+                    os.unlink(self.target)
+        if self._error:
+            raise self._error
+
+    def _discard(self):
+        if self.target != "-":
+            self._out.close()
+            os.unlink(self.target)
+
+# ----------------------------------------------------------------------
+# Export utilities
+# ----------------------------------------------------------------------
+def attachment_filename(resource: sqlite3.Row) -> str:
+    """Pick a filesystem-safe file name for an exported resource."""
+    # Use original filename if available, otherwise use title or ID
+    filename = resource["filename"] or resource["title"] or f"resource_{resource['id'][:8]}"
+    
+    # Ensure filename is safe for filesystem
+    safe_filename = "".join(c if c not in r'\/:*?"<>|' else "_" for c in filename)
+    
+    # If no extension, use the stored one or try to determine from mime type
+    if "." not in safe_filename:
+        mime = resource["mime"] or ""
+        if resource["file_extension"]:
+            safe_filename = f"{safe_filename}.{resource['file_extension']}"
+        elif mime.startswith("image/"):
+            ext = mime.split("/")[-1]
+            if ext:
+                safe_filename = f"{safe_filename}.{ext}"
+        elif mime == "application/pdf":
+            safe_filename = f"{safe_filename}.pdf"
+        elif mime.startswith("text/"):
+            ext = mime.split("/")[-1] or "txt"
+            safe_filename = f"{safe_filename}.{ext}"
+    return safe_filename
+
+def extract_attachments(db: JoplinDB, resources: List[sqlite3.Row], note_title: str, out_dir: Path, mode: str = "copy", verbose: bool = True, sink=None) -> Dict[str, str]:
+    """
+    Extract and save file attachments from a note.
+    
+    Args:
+        db: Database instance (its resource store locates the files)
+        resources: List of resource rows for the note
+        note_title: Title of the note (used for creating directory name)
+        out_dir: Output directory for the note
+        mode: How to place attachment files (see place_file)
+        verbose: Print a line per attachment (warnings and errors are always printed)
+        sink: DirectorySink or ArchiveSink to write the files to (default: the file system)
+        
+    Returns:
+        Dict mapping resource IDs to their saved file paths
+    """
+    saved_files = {}
+    
+    if not resources:
+        return saved_files
+    
+    # Create attachments directory
+    safe_title = "".join(c if c not in r'\/:*?"<>|' else "_" for c in note_title)
+    attachments_dir = out_dir / "attachments" / safe_title
+    sink = sink or DirectorySink()
+    sink.makedirs(attachments_dir)
+    
+    if verbose:
+        print(f"    Extracting {len(resources)} attachments...")
+    
+    used_names: set = set()
+    for resource in resources:
+        try:
+            source = db.resource_store.path_for(resource)
+            if not source:
+                print(f"    ⚠️  Resource file not found: {resource['title']}")
+                continue
+                
+            safe_filename = attachment_filename(resource)
+            if safe_filename in used_names:
+                # Distinct resources sharing a file name (e.g. pasted image.png) get their ID added
+                name = Path(safe_filename)
+                safe_filename = f"{name.stem} ({resource['id'][:8]}){name.suffix}"
+            used_names.add(safe_filename)
+            file_path = attachments_dir / safe_filename
+            
+            # Link/clone or copy the file without pulling it through Python buffers
+            used = sink.add_file(source, file_path, mode)
+            
+            saved_files[resource["id"]] = str(file_path.relative_to(out_dir))
+            if verbose:
+                via = f", {used}" if used != "copy" or mode != "copy" else ""
+                print(f"    ✓ {safe_filename} ({resource['mime'] or 'unknown'}{via})")
+            
+        except Exception as e:
+            print(f"    ❌ Failed to extract {resource['title']}: {e}")
+    
+    return saved_files
+
+class ContentStore:
+    """
+    Content-addressed attachment directory inside an export.
+
+    Every distinct attachment is stored once as `<root>/<xx>/<sha256>.<ext>`,
+    however many notes link to it and however often the same file was
+    pasted into Joplin as separate resources. Files go through `sink`
+    (a DirectorySink unless the export is streamed into an archive).
+    """
+
+    DIR_NAME = "_attachments"
+
+    def __init__(self, root: Path, mode: str = "copy", sink=None):
+        self.root = root
+        self.mode = mode
+        self.sink = sink or DirectorySink()
+        # Resource ID -> stored file, so each resource is hashed once per run
+        self._by_resource: Dict[str, Path] = {}
+
+    def store(self, source: Path, resource: sqlite3.Row) -> Tuple[Path, bool]:
+        """
+        Store a resource file, unless identical content is already stored.
+
+        Returns:
+            (stored file path, whether a new file was written)
+        """
+        known = self._by_resource.get(resource["id"])
+        if known:
+            return known, False
+        suffix = Path(attachment_filename(resource)).suffix
+        if self.mode == "copy" and isinstance(self.sink, DirectorySink):
+            path, written = self._copy_hashed(source, suffix, partial_path(self.root / resource["id"]))
+        else:
+            # Links never read the file and archive entries are named before
+            # their data, so the hash has to come first
+            digest = hash_file(source)
+            path = self.root / digest[:2] / f"{digest}{suffix}"
+            written = False
+            if not self.sink.exists(path):
+                self.sink.makedirs(path.parent)
+                self.sink.add_file(source, path, self.mode)
+                written = True
+        self._by_resource[resource["id"]] = path
+        return path, written
+
+    def _copy_hashed(self, source: Path, suffix: str, tmp_path: Path) -> Tuple[Path, bool]:
+        """Hash a file while copying it to tmp_path, then rename it to its digest (or drop a duplicate)."""
+        self.sink.makedirs(self.root)
+        try:
+            digest = copy_and_hash(source, tmp_path)
+            path = self.root / digest[:2] / f"{digest}{suffix}"
+            if path.exists():
+                tmp_path.unlink()
+                return path, False
+            self.sink.makedirs(path.parent)
+            os.replace(tmp_path, path)
+            return path, True
+        except BaseException:
+            # Never leave a partial file behind (disk full, I/O error, Ctrl-C)
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+
+def store_attachments_deduplicated(db: JoplinDB, resources: List[sqlite3.Row], out_dir: Path, store: ContentStore, verbose: bool = True) -> Dict[str, str]:
+    """
+    Save a note's attachments into a content-addressed store, printing newly
+    stored files when verbose.
+
+    Returns:
+        Dict mapping resource IDs to stored file paths relative to out_dir
+    """
+    saved_files = {}
+    for resource in resources:
+        try:
+            source = db.resource_store.path_for(resource)
+            if not source:
+                print(f"    ⚠️  Resource file not found: {resource['title']}")
+                continue
+            path, written = store.store(source, resource)
+            saved_files[resource["id"]] = os.path.relpath(path, out_dir)
+            if written and verbose:
+                print(f"    ✓ {resource['title']} → {path.relative_to(store.root.parent)}")
+        except Exception as e:
+            print(f"    ❌ Failed to extract {resource['title']}: {e}")
+    return saved_files
+
+def safe_name(name: str) -> str:
+    """Make a title safe to use as a file name."""
+    return "".join(c if c not in r'\/:*?"<>|' else "_" for c in name)
+
+def note_extension(format_type: str) -> str:
+    format_type = format_type.lower()
+    return format_type if format_type in ("md", "html") else "txt"
+
+# Joplin links notes and resources as ":/<32 hex id>"
+JOPLIN_LINK_RE = re.compile(r"(?<![\w/]):/([0-9a-f]{32})(?![0-9a-f])")
+
+def rewrite_links(body: str, note_dir: Path, note_paths: Dict[str, Path], saved_files: Dict[str, str], anchors: bool = False) -> str:
+    """
+    Point Joplin's internal ":/id" links at the exported files, in one pass.
+
+    Args:
+        body: Note body
+        note_dir: Directory the note is written to (links are made relative to it)
+        note_paths: Note IDs mapped to their output file
+        saved_files: Resource IDs mapped to attachment paths relative to note_dir
+        anchors: Link to the note's `note-<id>` anchor within its file
+            (for notebooks exported as single files)
+
+    Links to notes or resources that were not exported are left as they are.
+    """
+    def replace(match):
+        target_id = match.group(1)
+        fragment = ""
+        if target_id in saved_files:
+            target = saved_files[target_id]
+        elif target_id in note_paths:
+            target = os.path.relpath(note_paths[target_id], note_dir)
+            if anchors:
+                fragment = f"#note-{target_id}"
+        else:
+            return match.group(0)
+        return quote(target.replace(os.sep, "/")) + fragment
+
+    return JOPLIN_LINK_RE.sub(replace, body)
+
+# Inline Markdown understood by the built-in renderer: code, images, links,
+# bold, italics, strikethrough and bare URLs
+MD_INLINE_RE = re.compile(
+    r"`([^`]+)`"
+    r"|(!?)\[([^\]]*)\]\(\s*<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\s*\)"
+    r"|\*\*(.+?)\*\*|__(.+?)__"
+    r"|(?<![\w*])\*(?![\s*])(.+?)(?<![\s*])\*"
+    r"|~~(.+?)~~"
+    r"|(https?://[^\s<>()]+)"
+)
+MD_LIST_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s+(.*)$")
+
+def render_markdown_inline(text: str) -> str:
+    out: List[str] = []
+    pos = 0
+    for match in MD_INLINE_RE.finditer(text):
+        out.append(html.escape(text[pos:match.start()], quote=False))
+        code, bang, label, url, strong, strong_alt, emphasis, strike, bare_url = match.groups()
+        if code is not None:
+            out.append(f"<code>{html.escape(code, quote=False)}</code>")
+        elif url is not None and bang:
+            out.append(f'<img src="{html.escape(url)}" alt="{html.escape(label)}">')
+        elif url is not None:
+            out.append(f'<a href="{html.escape(url)}">{render_markdown_inline(label) or html.escape(url)}</a>')
+        elif strong is not None or strong_alt is not None:
+            out.append(f"<strong>{render_markdown_inline(strong or strong_alt)}</strong>")
+        elif emphasis is not None:
+            out.append(f"<em>{render_markdown_inline(emphasis)}</em>")
+        elif strike is not None:
+            out.append(f"<del>{render_markdown_inline(strike)}</del>")
+        else:
+            out.append(f'<a href="{html.escape(bare_url)}">{html.escape(bare_url)}</a>')
+        pos = match.end()
+    out.append(html.escape(text[pos:], quote=False))
+    return "".join(out)
+
+def render_markdown_minimal(text: str) -> str:
+    """
+    Render the common subset of Markdown: headings, paragraphs, fenced code,
+    block quotes, (checkbox) lists, rules and the inline markup above.
+    Raw HTML in the note is escaped.
+    """
+    out: List[str] = []
+    lines = text.splitlines()
+    paragraph: List[str] = []
+
+    def flush_paragraph():
+        if paragraph:
+            out.append(f"<p>{render_markdown_inline(chr(10).join(paragraph))}</p>\n")
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if stripped.startswith(("```", "~~~")):
+            flush_paragraph()
+            fence = stripped[:3]
+            code: List[str] = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            out.append(f"<pre><code>{html.escape(chr(10).join(code), quote=False)}</code></pre>\n")
+        elif not stripped:
+            flush_paragraph()
+        elif re.match(r"#{1,6}\s", stripped):
+            flush_paragraph()
+            level = len(stripped) - len(stripped.lstrip("#"))
+            out.append(f"<h{level}>{render_markdown_inline(stripped[level:].strip().rstrip('#').strip())}</h{level}>\n")
+        elif re.fullmatch(r"(\*\s*){3,}|(-\s*){3,}|(_\s*){3,}", stripped):
+            flush_paragraph()
+            out.append("<hr>\n")
+        elif stripped.startswith(">"):
+            flush_paragraph()
+            quoted: List[str] = []
+            while i < len(lines) and lines[i].strip().startswith(">"):
+                quoted_line = lines[i].strip()[1:]
+                quoted.append(quoted_line[1:] if quoted_line.startswith(" ") else quoted_line)
+                i += 1
+            out.append(f"<blockquote>\n{render_markdown_minimal(chr(10).join(quoted))}</blockquote>\n")
+            continue
+        elif MD_LIST_RE.match(line):
+            flush_paragraph()
+            ordered = MD_LIST_RE.match(line).group(1)[0].isdigit()
+            tag = "ol" if ordered else "ul"
+            out.append(f"<{tag}>\n")
+            while i < len(lines) and MD_LIST_RE.match(lines[i]):
+                marker, item = MD_LIST_RE.match(lines[i]).groups()
+                if marker[0].isdigit() != ordered:
+                    break
+                checkbox = re.match(r"\[([ xX])\]\s*", item)
+                if checkbox:
+                    box = "☑" if checkbox.group(1) != " " else "☐"
+                    item = f"{box} {render_markdown_inline(item[checkbox.end():])}"
+                else:
+                    item = render_markdown_inline(item)
+                out.append(f"<li>{item}</li>\n")
+                i += 1
+            out.append(f"</{tag}>\n")
+            continue
+        else:
+            paragraph.append(stripped)
+        i += 1
+    flush_paragraph()
+    return "".join(out)
+
+# One markdown.Markdown per thread: instances keep state between conversions
+_markdown_local = threading.local()
+
+def _markdown_converter():
+    converter = getattr(_markdown_local, "converter", None)
+    if converter is None:
+        converter = markdown.Markdown(extensions=["fenced_code", "tables", "sane_lists"])
+        # Escape raw HTML like the built-in renderer instead of passing it through
+        converter.preprocessors.deregister("html_block")
+        converter.inlinePatterns.deregister("html")
+        _markdown_local.converter = converter
+    return converter
+
+def render_markdown(text: str) -> str:
+    """Convert a note body to HTML, with the markdown package when it is installed."""
+    if markdown is not None:
+        converter = _markdown_converter()
+        try:
+            return converter.convert(text)
+        finally:
+            converter.reset()
+    return render_markdown_minimal(text)
+
+HTML_STYLE = (
+    "body{font:16px/1.6 system-ui,sans-serif;max-width:50em;margin:2em auto;padding:0 1em;color:#222}"
+    "pre,code{background:#f4f4f4}pre{padding:.8em;overflow:auto}img{max-width:100%}"
+    "blockquote{border-left:3px solid #ccc;margin-left:0;padding-left:1em;color:#555}"
+    "nav,.meta{color:#666;font-size:.9em}ul.index{list-style:none;padding-left:0}"
+)
+
+def html_page(title: str, content: str, head: str = "") -> str:
+    """Wrap rendered content in a standalone HTML page."""
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n"
+        f"<title>{html.escape(title)}</title>\n<style>{HTML_STYLE}</style>\n{head}</head>\n"
+        f"<body>\n{content}</body>\n</html>\n"
+    )
+
+def render_note_html(note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], include_metadata: bool, saved_files: Dict[str, str], body: str, nav: bool = False) -> str:
+    """Render a note as an HTML page (see render_note); nav links it to its notebook's index page."""
+    out: List[str] = []
+    if nav:
+        out.append('<nav><a href="index.html">↑ Notebook</a></nav>\n')
+    out.append(f"<h1>{html.escape(note['title'])}</h1>\n")
+    if include_metadata:
+        meta = [f"Created: {ts_to_str(note['created_time'])}", f"Updated: {ts_to_str(note['updated_time'])}"]
+        if tags:
+            meta.append(f"Tags: {', '.join(tags)}")
+        out.append(f'<p class="meta">{html.escape(" · ".join(meta))}</p>\n<hr>\n')
+    out.append(render_markdown(body))
+    if include_metadata and resources:
+        out.append("<h2>Attachments</h2>\n<ul>\n")
+        for res in resources:
+            target = saved_files[res["id"]].replace(os.sep, "/") if res["id"] in saved_files else res["filename"] or "unknown"
+            out.append(f'<li><a href="{html.escape(quote(target))}">{html.escape(res["title"] or "")}</a></li>\n')
+        out.append("</ul>\n")
+    return html_page(note["title"], "".join(out))
+
+def render_note(note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], format_type: str = "md", include_metadata: bool = False, saved_files: Optional[Dict[str, str]] = None, body: Optional[str] = None, nav: bool = False) -> str:
+    """
+    Render a note as markdown (.md), plain text (.txt) or an HTML page (.html).
+
+    Args:
+        note: The note row from database
+        tags: List of tags for the note
+        resources: List of resources/attachments for the note
+        format_type: "md" for markdown, "txt" for plain text, "html" for HTML
+        include_metadata: Whether to include metadata (timestamps, tags, attachments)
+        saved_files: Resource IDs mapped to extracted attachment paths
+        body: Note body to render instead of note["body"] (e.g. with links rewritten)
+        nav: Link HTML pages to their notebook's index page
+
+    Returns:
+        The rendered file content
+    """
+    saved_files = saved_files or {}
+    if body is None:
+        body = note["body"] or ""
+    if format_type.lower() == "html":
+        return render_note_html(note, tags, resources, include_metadata, saved_files, body, nav)
+    out: List[str] = []
+    if format_type.lower() == "md":
+        # Markdown format
+        out.append(f"# {note['title']}\n\n")
+        
+        if include_metadata:
+            out.append(f"*Created:* {ts_to_str(note['created_time'])}\n")
+            out.append(f"*Updated:* {ts_to_str(note['updated_time'])}\n")
+            if tags:
+                out.append(f"*Tags:* {', '.join(tags)}\n")
+            out.append("\n---\n\n")
+        
+        out.append(body)
+        out.append("\n")
+
+        if include_metadata and resources:
+            out.append("\n## Attachments\n")
+            for res in resources:
+                # Use saved file path if available, otherwise use original filename
+                if res["id"] in saved_files:
+                    out.append(f"- [{res['title']}]({saved_files[res['id']]})\n")
+                else:
+                    out.append(f"- [{res['title']}]({res['filename'] or 'unknown'})\n")
+    else:
+        # Plain text format
+        out.append(f"{note['title']}\n")
+        out.append("=" * len(note['title']) + "\n\n")
+        
+        if include_metadata:
+            out.append(f"Created: {ts_to_str(note['created_time'])}\n")
+            out.append(f"Updated: {ts_to_str(note['updated_time'])}\n")
+            if tags:
+                out.append(f"Tags: {', '.join(tags)}\n")
+            out.append("\n" + "-" * 40 + "\n\n")
+        
+        out.append(body)
+        out.append("\n")
+
+        if include_metadata and resources:
+            out.append("\n\nAttachments:\n")
+            for res in resources:
+                if res["id"] in saved_files:
+                    out.append(f"- {res['title']} ({saved_files[res['id']]})\n")
+                else:
+                    out.append(f"- {res['title']} ({res['filename'] or 'unknown'})\n")
+    return "".join(out)
+
+def render_note_file(file_path: Path, note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], format_type: str, include_metadata: bool, saved_files: Dict[str, str], previous_hash: Optional[str] = None, note_paths: Optional[Dict[str, Path]] = None) -> Tuple[str, Optional[bytes]]:
+    """
+    Render the file content for a note that will be written to file_path
+    (safe to run on a worker thread).
+
+    Links to other notes in note_paths and to saved attachments are
+    rewritten to paths relative to file_path while rendering.
+
+    Returns:
+        (content hash, UTF-8 content), with None as content when it still
+        matches previous_hash and the file exists, so it needs no rewrite
+    """
+    body = rewrite_links(note["body"] or "", file_path.parent, note_paths or {}, saved_files)
+    data = render_note(note, tags, resources, format_type, include_metadata, saved_files, body, bool(note_paths)).encode("utf-8")
+    content_hash = hashlib.sha256(data).hexdigest()
+    if previous_hash == content_hash and file_path.exists():
+        return content_hash, None
+    return content_hash, data
+
+# Planned note paths of an HTML export, handed to each worker process once
+# by the pool initializer instead of being pickled with every note (None
+# outside worker processes)
+_worker_note_paths: Optional[Dict[str, Path]] = None
+
+def _init_render_worker(note_paths: Dict[str, Path]):
+    global _worker_note_paths
+    _worker_note_paths = note_paths
+    # Ctrl-C is handled by the exporting process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def render_note_job(file_path: Path, note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], format_type: str, include_metadata: bool, saved_files: Dict[str, str], previous_hash: Optional[str] = None, note_paths: Optional[Dict[str, Path]] = None, sink=None) -> Tuple[str, Optional[bytes], int, Optional[List[str]]]:
+    """
+    Render a note for NotebookExporter on a worker thread or process (see
+    render_note_file), writing it to sink right away when one is given.
+
+    Workers in a process pool get plain dicts with just the rendered fields
+    instead of rows. Their note_paths only holds notes planned after the
+    pool started, which are added to the copy the pool initializer gave them.
+
+    Returns:
+        (content hash, UTF-8 content unless it was written to sink or needs
+        no rewrite, its size in bytes, search terms of HTML notes or None)
+    """
+    if _worker_note_paths is not None:
+        _worker_note_paths.update(note_paths or {})
+        note_paths = _worker_note_paths
+    content_hash, data = render_note_file(file_path, note, tags, resources, format_type, include_metadata, saved_files,
+                                          previous_hash, note_paths)
+    size = len(data) if data is not None else 0
+    if data is not None and sink is not None:
+        sink.write(file_path, data)
+        # Only send back what the exporter needs; the file is already written
+        data = None
+    terms = SearchIndex.terms(note["title"], note["body"]) if format_type == "html" else None
+    return content_hash, data, size, terms
+
+def note_to_json(note: sqlite3.Row, tags: List[str], resource_ids: List[str], notebook: Optional[str] = None, include_body: bool = True) -> Dict[str, Any]:
+    """
+    Describe a note as a JSON-able dict (times are Joplin's Unix milliseconds).
+
+    Works on full rows and on body-less summaries (pass include_body=False).
+    """
+    data = {
+        "id": note["id"],
+        "title": note["title"],
+        "parent_id": note["parent_id"],
+        "notebook": notebook,
+        "created_time": note["created_time"],
+        "updated_time": note["updated_time"],
+        "is_todo": bool(note["is_todo"]),
+        "tags": tags,
+        "resource_ids": resource_ids,
+    }
+    if include_body:
+        data["body"] = note["body"] or ""
+    return data
+
+def write_note_file(file_path: Path, note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], format_type: str, include_metadata: bool, saved_files: Dict[str, str], previous_hash: Optional[str] = None, note_paths: Optional[Dict[str, Path]] = None) -> Tuple[str, int]:
+    """
+    Render a note and write it to file_path (see render_note_file).
+
+    Returns:
+        (content hash, number of bytes written); nothing is written (0) when
+        the rendered content still matches previous_hash
+    """
+    content_hash, data = render_note_file(file_path, note, tags, resources, format_type, include_metadata,
+                                          saved_files, previous_hash, note_paths)
+    if data is None:
+        return content_hash, 0
+    DirectorySink().write(file_path, data)
+    return content_hash, len(data)
+
+def export_note_to_format(note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], out_dir: Path, format_type: str = "md", include_metadata: bool = False, db: Optional[JoplinDB] = None, attachment_mode: str = "copy"):
+    """
+    Export a note to markdown (.md), text (.txt) or HTML (.html) format.
+    
+    Args:
+        note: The note row from database
+        tags: List of tags for the note
+        resources: List of resources/attachments for the note
+        out_dir: Output directory
+        format_type: "md" for markdown, "txt" for plain text, "html" for HTML
+        include_metadata: Whether to include metadata (timestamps, tags, attachments)
+        db: Database instance (required for extracting attachments)
+        attachment_mode: How attachments are placed (see place_file)
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    file_path = out_dir / f"{safe_name(note['title'])}.{note_extension(format_type)}"
+
+    # Extract attachments if database is provided and metadata is included
+    saved_files = {}
+    if include_metadata and db and resources:
+        saved_files = extract_attachments(db, resources, note["title"], out_dir, attachment_mode)
+
+    write_note_file(file_path, note, tags, resources, format_type, include_metadata, saved_files)
+    print(f" → {file_path}")
+
+class ExportManifest:
+    """
+    Record of the files a previous export wrote, stored in the export directory.
+
+    Maps note IDs to their output path (relative to the export root),
+    updated_time, content hash, folder, attachment files and where the
+    notes and attachments they link to were exported, and notebook
+    IDs to their directories, so later exports can skip unchanged notes and
+    clean up after deleted or moved notes and notebooks.
+    """
+
+    FILE_NAME = ".joplin-export-manifest.json"
+    VERSION = 1
+
+    def __init__(self, root: Path, options: Dict[str, Any]):
+        self.root = root
+        self.options = options
+        self.notes: Dict[str, Dict[str, Any]] = {}
+        self.folders: Dict[str, str] = {}
+        self.current_folders: set = set()
+        self.stale_dirs: List[str] = []
+        self.rewrite_all = False
+        self.seen: set = set()
+        self.current_paths: set = set()
+        self.stats: Dict[str, int] = {"new": 0, "updated": 0, "moved": 0, "unchanged": 0, "deleted": 0, "filtered": 0}
+
+        path = root / self.FILE_NAME
+        if path.exists():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == self.VERSION:
+                self.notes = data.get("notes", {})
+                self.folders = data.get("folders", {})
+                # A different format, metadata setting or filter forces every
+                # note to be rewritten; old files are still cleaned up via their entries
+                self.rewrite_all = data.get("options") != options
+
+    def lookup(self, note_id: str) -> Optional[Dict[str, Any]]:
+        return self.notes.get(note_id)
+
+    def is_current(self, note: sqlite3.Row, file_path: Path, links: Dict[str, Optional[str]]) -> bool:
+        """
+        Whether the note's file from the last export is still up to date:
+        neither the note nor the exported paths of what it links to (see
+        NotebookExporter._link_targets) have changed.
+        """
+        entry = self.notes.get(note["id"])
+        return bool(
+            not self.rewrite_all
+            and entry
+            and entry["updated_time"] == note["updated_time"]
+            and entry["path"] == self.relative(file_path)
+            and entry.get("links", {}) == links
+            and file_path.exists()
+        )
+
+    def relative(self, file_path: Path) -> str:
+        return file_path.relative_to(self.root).as_posix()
+
+    def record(self, note: sqlite3.Row, file_path: Path, content_hash: Optional[str], written: bool,
+               attachments: Optional[List[Path]] = None, links: Optional[Dict[str, Optional[str]]] = None):
+        """
+        Remember a note's output and count what happened to it.
+
+        attachments are the files extracted for the note in this run and
+        links its link targets (None when it was skipped, which keeps the
+        ones recorded last time).
+        """
+        path = self.relative(file_path)
+        previous = self.notes.get(note["id"])
+        files = [self.relative(f) for f in attachments] if attachments is not None else None
+        if previous is None:
+            self.stats["new"] += 1
+        elif previous["path"] != path:
+            self.stats["moved"] += 1
+            self._remove_file(previous["path"])
+        elif written:
+            self.stats["updated"] += 1
+        else:
+            self.stats["unchanged"] += 1
+        if previous:
+            if content_hash is None:
+                content_hash = previous.get("hash")
+            if files is None:
+                files = previous.get("attachments", [])
+            if links is None:
+                links = previous.get("links", {})
+            for old in set(previous.get("attachments", [])) - set(files):
+                self._remove_file(old)
+        self.notes[note["id"]] = {
+            "path": path,
+            "updated_time": note["updated_time"],
+            "hash": content_hash,
+            "folder_id": note["parent_id"],
+            "attachments": files or [],
+            "links": links or {},
+        }
+        self.seen.add(note["id"])
+        self.current_paths.add(path)
+        self.current_paths.update(files or [])
+
+    def record_folder(self, folder_id: str, folder_dir: Path):
+        """Remember the directory a notebook was exported to."""
+        relative_dir = self.relative(folder_dir)
+        previous = self.folders.get(folder_id)
+        if previous is not None and previous != relative_dir:
+            # Renamed or moved: its old directory goes once its notes have moved out
+            self.stale_dirs.append(previous)
+        self.folders[folder_id] = relative_dir
+        self.current_folders.add(folder_id)
+
+    def unseen(self, folder_ids: Optional[set]) -> List[str]:
+        """IDs of notes exported from these folders (None: from anywhere) last time but not seen in this run."""
+        return [note_id for note_id, entry in self.notes.items()
+                if note_id not in self.seen and (folder_ids is None or entry.get("folder_id") in folder_ids)]
+
+    def prune(self, folder_ids: Optional[set], filtered: Optional[set] = None) -> List[str]:
+        """
+        Delete files of notes that were exported from these folders last
+        time but were not seen in this run (deleted or moved elsewhere).
+
+        With folder_ids None the run exported the whole tree, so every note
+        not seen is pruned, and so are the directories of notebooks that
+        were not exported again (deleted ones) once they are empty.
+
+        Notes in `filtered` still exist but no longer match the export
+        filter; they are counted apart from deleted ones.
+        """
+        filtered = filtered or set()
+        removed = []
+        for note_id in self.unseen(folder_ids):
+            entry = self.notes.pop(note_id)
+            for relative_path in [entry["path"], *entry.get("attachments", [])]:
+                self._remove_file(relative_path)
+            removed.append(entry["path"])
+            self.stats["filtered" if note_id in filtered else "deleted"] += 1
+        if folder_ids is None:
+            for folder_id, relative_dir in list(self.folders.items()):
+                if folder_id not in self.current_folders:
+                    del self.folders[folder_id]
+                    self.stale_dirs.append(relative_dir)
+        for relative_dir in self.stale_dirs:
+            if self.options.get("format") == "html":
+                # The notebook's own page, written by the site export
+                self._remove_file(f"{relative_dir}/index.html")
+            self._remove_empty_dirs(self.root / relative_dir)
+        self.stale_dirs = []
+        return removed
+
+    def _remove_file(self, relative_path: str):
+        # Another note may have taken over this path during the current run
+        if relative_path in self.current_paths:
+            return
+        path = self.root / relative_path
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        self._remove_empty_dirs(path.parent)
+
+    def _remove_empty_dirs(self, directory: Path):
+        """Remove directory and its parents while they are empty, but never the export root itself."""
+        while directory != self.root and self.root in directory.parents:
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+            directory = directory.parent
+
+    def save(self):
+        """Write the manifest atomically next to the exported files."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / self.FILE_NAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "options": self.options, "notes": self.notes, "folders": self.folders}, f)
+        os.replace(tmp_path, path)
+
+    def summary(self) -> str:
+        return ", ".join(f"{count} {label}" for label, count in self.stats.items())
+
+class ExportJournal:
+    """
+    Checkpoint log of an export in progress, kept in the export directory.
+
+    One JSON object per line: a header with the export options, then an
+    entry for every note file written and every top-level notebook
+    finished. The journal is removed when the export completes, so one
+    left behind means the previous export was interrupted and can be
+    resumed from it.
+    """
+
+    FILE_NAME = ".joplin-export-journal"
+
+    def __init__(self, root: Path, options: Dict[str, Any], resume: bool = False):
+        self.path = root / self.FILE_NAME
+        self.notes: Dict[str, Optional[str]] = {}
+        self.folders: set = set()
+        self.resumed = False
+
+        if self.path.exists():
+            if resume:
+                self.resumed = self._load(options)
+                if not self.resumed:
+                    print("Previous export used different options; starting over.")
+            else:
+                print("Found an interrupted export; starting over (use --resume to continue it).")
+        root.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a" if self.resumed else "w", encoding="utf-8")
+        if not self.resumed:
+            self._append({"options": options})
+
+    def _load(self, options: Dict[str, Any]) -> bool:
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            return False
+        if header.get("options") != options:
+            return False
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may have been cut short by the crash
+                continue
+            if "note" in entry:
+                self.notes[entry["note"]] = entry.get("hash")
+            elif "folder" in entry:
+                self.folders.add(entry["folder"])
+        return True
+
+    def _append(self, entry: Dict[str, Any], sync: bool = False):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def note_done(self, note_id: str, content_hash: Optional[str]):
+        self._append({"note": note_id, "hash": content_hash})
+
+    def folder_done(self, folder_id: str):
+        self.folders.add(folder_id)
+        self._append({"folder": folder_id}, sync=True)
+
+    def close(self, complete: bool):
+        """Close the journal, deleting it if the export finished."""
+        self._file.close()
+        if complete:
+            self.path.unlink()
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class ExportProgress:
+    """
+    Progress of a long export: notes/s, MB/s written, attachments, elapsed time and ETA.
+
+    Instead of a line per note, a status line is drawn on stderr at most
+    every REFRESH seconds (redrawn in place on a terminal, appended every
+    LOG_INTERVAL seconds otherwise). Totals come from
+    JoplinDB.get_export_totals so the ETA is known from the start.
+    """
+
+    REFRESH = 0.2
+    LOG_INTERVAL = 5.0
+
+    def __init__(self, quiet: bool = False, stream=None):
+        self.quiet = quiet
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.totals = {"notes": 0, "bytes": 0, "attachments": 0, "attachment_bytes": 0}
+        self.notes = 0
+        self.written = 0
+        self.bytes = 0
+        self.attachments = 0
+        self.attachment_bytes = 0
+        self.started = time.monotonic()
+        self._last_draw = self.started
+        self._drawn = False
+
+    def add_totals(self, totals: Dict[str, int]):
+        for key, value in totals.items():
+            self.totals[key] = self.totals.get(key, 0) + (value or 0)
+
+    def note_done(self, bytes_written: int = 0, count: int = 1):
+        self.notes += count
+        if bytes_written:
+            self.written += count
+            self.bytes += bytes_written
+        self.update()
+
+    def attachments_done(self, count: int, size: int):
+        self.attachments += count
+        self.attachment_bytes += size
+
+    def log(self, message: str):
+        """Print a message without garbling the status line."""
+        if self.quiet:
+            return
+        self._clear()
+        print(message)
+
+    def update(self, force: bool = False):
+        if self.quiet:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_draw < (self.REFRESH if self.tty else self.LOG_INTERVAL):
+            return
+        self._last_draw = now
+        line = self.status()
+        if self.tty:
+            self.stream.write(f"\r\x1b[K{line}")
+            self._drawn = True
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def _clear(self):
+        if self._drawn:
+            self.stream.write("\r\x1b[K")
+            self.stream.flush()
+            self._drawn = False
+
+    def status(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        total = self.totals["notes"]
+        rate = self.notes / elapsed
+        parts = [f"{self.notes}/{total} notes ({100 * self.notes // total if total else 100}%)",
+                 f"{rate:.1f} notes/s",
+                 f"{(self.bytes + self.attachment_bytes) / elapsed / 1e6:.1f} MB/s",
+                 f"{self.attachments} attachments",
+                 f"{format_duration(elapsed)} elapsed"]
+        if rate and total > self.notes:
+            parts.append(f"ETA {format_duration((total - self.notes) / rate)}")
+        return " · ".join(parts)
+
+    def finish(self) -> Dict[str, Any]:
+        """Draw the final status line and return the summary of the run."""
+        if not self.quiet:
+            self.update(force=True)
+            if self.tty:
+                self.stream.write("\n")
+                self._drawn = False
+        elapsed = time.monotonic() - self.started
+        return {
+            "notes": self.notes,
+            "notes_total": self.totals["notes"],
+            "written": self.written,
+            "skipped": self.notes - self.written,
+            "bytes": self.bytes,
+            "attachments": self.attachments,
+            "attachment_bytes": self.attachment_bytes,
+            "elapsed_seconds": round(elapsed, 3),
+            "notes_per_second": round(self.notes / elapsed, 1) if elapsed else None,
+            "mb_per_second": round((self.bytes + self.attachment_bytes) / elapsed / 1e6, 2) if elapsed else None,
+        }
+
+class SearchIndex:
+    """
+    Inverted index of the notes in an HTML export, for its search page.
+
+    Terms are the lower-cased words (2-32 characters) of each note's title
+    and body, and each maps to the numbers of the notes containing it, kept
+    in compact arrays while exporting. The index is written as JavaScript
+    files that search.html loads with <script> tags, so searching also works
+    when the export is opened straight from disk (file:// URLs). Terms are
+    sharded by their first character, so a query only loads the shards of
+    its words; postings are stored as gaps between note numbers, and notes
+    refer to their notebook by number.
+    """
+
+    DIR_NAME = "_search"
+    SHARDS = "0123456789abcdefghijklmnopqrstuvwxyz_"
+    WORD_RE = re.compile(r"\w+")
+
+    def __init__(self):
+        self.docs: List[Tuple[str, str, int]] = []
+        self.notebooks: List[Tuple[str, str]] = []
+        self._notebook_numbers: Dict[Tuple[str, str], int] = {}
+        self.postings: Dict[str, array] = {}
+
+    @classmethod
+    def terms(cls, title: str, body: Optional[str]) -> List[str]:
+        words = cls.WORD_RE.findall(f"{title}\n{body or ''}".lower())
+        return sorted({word for word in words if 2 <= len(word) <= 32})
+
+    @classmethod
+    def shard(cls, term: str) -> str:
+        return term[0] if term[0] in cls.SHARDS else "_"
+
+    def add(self, title: str, href: str, notebook: str, notebook_href: str, terms: List[str]):
+        """
+        Index a note: href is its URL relative to its notebook's directory,
+        notebook_href the URL of that directory relative to the export root.
+        """
+        key = (notebook, notebook_href)
+        number = self._notebook_numbers.get(key)
+        if number is None:
+            number = self._notebook_numbers[key] = len(self.notebooks)
+            self.notebooks.append(key)
+        doc = len(self.docs)
+        self.docs.append((title, href, number))
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array("I")
+            postings.append(doc)
+
+    @staticmethod
+    def _script(name: str, data: Any) -> bytes:
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return f"joplinSearch.load({json.dumps(name)},{payload});\n".encode("utf-8")
+
+    def write(self, sink, root: Path):
+        """Write docs.js and one <shard>.js per shard (empty shards too, replacing stale ones)."""
+        directory = root / self.DIR_NAME
+        sink.makedirs(directory)
+        sink.write(directory / "docs.js", self._script("docs", {"notebooks": self.notebooks, "notes": self.docs}))
+        shard_terms: Dict[str, List[str]] = {name: [] for name in self.SHARDS}
+        for term in self.postings:
+            shard_terms[self.shard(term)].append(term)
+        for name, terms in shard_terms.items():
+            encoded = {}
+            for term in sorted(terms):
+                postings = self.postings[term]
+                encoded[term] = [postings[0]] + [b - a for a, b in zip(postings, postings[1:])]
+            sink.write(directory / f"{name}.js", self._script(name, encoded))
+
+SEARCH_PAGE_SCRIPT = r"""
+var joplinSearch = (function () {
+  var data = {}, waiting = {};
+  function load(name, value) {
+    data[name] = value;
+    (waiting[name] || []).forEach(function (done) { done(); });
+    delete waiting[name];
+  }
+  function need(name, done) {
+    if (data[name]) return done();
+    if (waiting[name]) return waiting[name].push(done);
+    waiting[name] = [done];
+    var script = document.createElement("script");
+    script.src = "_search/" + name + ".js";
+    document.head.appendChild(script);
+  }
+  function shard(term) {
+    return /[0-9a-z]/.test(term[0]) ? term[0] : "_";
+  }
+  function matches(word) {
+    // Every note containing a term that starts with the word
+    var found = {}, terms = data[shard(word)];
+    for (var term in terms) {
+      if (term.lastIndexOf(word, 0) !== 0) continue;
+      var doc = 0;
+      terms[term].forEach(function (gap) { doc += gap; found[doc] = true; });
+    }
+    return found;
+  }
+  function search(query, show) {
+    var words = (query.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || []).filter(function (w) { return w.length > 1; });
+    var names = ["docs"].concat(words.map(shard)), pending = names.length;
+    names.forEach(function (name) {
+      need(name, function () {
+        if (--pending) return;
+        var hits = null;
+        words.forEach(function (word) {
+          var found = matches(word);
+          hits = hits ? hits.filter(function (doc) { return found[doc]; }) : Object.keys(found).map(Number);
+        });
+        var notes = data.docs.notes, notebooks = data.docs.notebooks;
+        hits = (hits || []).map(function (doc) {
+          var title = notes[doc][0].toLowerCase();
+          var score = words.filter(function (w) { return title.indexOf(w) >= 0; }).length;
+          return [score, doc];
+        }).sort(function (a, b) { return b[0] - a[0] || a[1] - b[1]; });
+        // [title, URL, notebook] of each hit, best first
+        show(hits.map(function (hit) {
+          var note = notes[hit[1]], notebook = notebooks[note[2]];
+          return [note[0], notebook[1] + note[1], notebook[0]];
+        }));
+      });
+    });
+  }
+  return {load: load, search: search};
+})();
+
+(function () {
+  var query = new URLSearchParams(location.search).get("q") || "";
+  var input = document.getElementById("q"), results = document.getElementById("results");
+  input.value = query;
+  if (!query) return;
+  results.textContent = "Searching…";
+  joplinSearch.search(query, function (docs) {
+    results.textContent = docs.length ? docs.length + " notes" : "No matches found.";
+    var list = document.createElement("ul");
+    list.className = "index";
+    docs.slice(0, 500).forEach(function (doc) {
+      var item = document.createElement("li"), link = document.createElement("a");
+      link.href = doc[1];
+      link.textContent = doc[0];
+      item.appendChild(link);
+      item.appendChild(document.createTextNode(" — " + doc[2]));
+      list.appendChild(item);
+    });
+    results.appendChild(list);
+  });
+})();
+"""
+
+def render_search_page() -> str:
+    form = ('<nav><a href="index.html">↑ All notebooks</a></nav>\n<h1>Search</h1>\n'
+            '<form><input id="q" name="q" size="40" autofocus> <button>Search</button></form>\n'
+            '<p id="results"></p>\n')
+    return html_page("Search", f"{form}<script>{SEARCH_PAGE_SCRIPT}</script>\n")
+
+def render_index_page(title: str, notebooks: List[Tuple[str, str, int]], notes: List[Tuple[str, str]], root: str, up: Optional[str] = None) -> str:
+    """
+    Render a notebook's index page of an HTML export.
+
+    Args:
+        title: Page title
+        notebooks: (title, href, note count) of each sub-notebook
+        notes: (title, href) of each note
+        root: URL of the export root relative to the page
+        up: URL of the parent's index page, if any
+    """
+    out: List[str] = ["<nav>"]
+    if up:
+        out.append(f'<a href="{html.escape(up)}">↑ Up</a> · ')
+    out.append(f'<form action="{html.escape(root)}search.html" style="display:inline">'
+               '<input name="q" placeholder="Search notes"></form></nav>\n')
+    out.append(f"<h1>{html.escape(title)}</h1>\n")
+    if notebooks:
+        out.append('<ul class="index">\n')
+        for name, href, count in notebooks:
+            out.append(f'<li>📁 <a href="{html.escape(href)}">{html.escape(name)}</a> ({count} notes)</li>\n')
+        out.append("</ul>\n")
+    if notes:
+        out.append('<ul class="index">\n')
+        for name, href in notes:
+            out.append(f'<li>📄 <a href="{html.escape(href)}">{html.escape(name)}</a></li>\n')
+        out.append("</ul>\n")
+    if not notebooks and not notes:
+        out.append("<p>(Empty notebook)</p>\n")
+    return html_page(title, "".join(out))
+
+class NotebookExporter:
+    """
+    Export notebooks recursively, optionally on a pool of worker threads.
+
+    The calling thread is the single database reader: it runs every query
+    (notes, tags, resources, attachments) and hands plain row data to the
+    workers, which render and write the note files. Finished notes are
+    reported in submission order and notes sharing a title get distinct
+    file names, so the output is the same for any number of jobs.
+
+    HTML exports render on worker processes, since converting Markdown is
+    CPU-bound, and finish with an index page per notebook plus a search
+    page and index (see SearchIndex) written at the export root.
+    """
+
+    # Note fields a worker process needs to render a note and its search terms
+    RENDER_COLUMNS = ("title", "body", "created_time", "updated_time")
+
+    def __init__(self, db: JoplinDB, format_type: str = "md", include_metadata: bool = False, jobs: int = 1, incremental: bool = False, attachment_mode: str = "copy", dedup_attachments: bool = False, resume: bool = False, progress: Optional[ExportProgress] = None, sink=None, note_filter: Optional[NoteFilter] = None):
+        """
+        Args:
+            db: Database instance
+            format_type: "md" for markdown, "txt" for plain text, "html"
+                for an HTML site with notebook index pages and search
+            include_metadata: Whether to include metadata in exported files
+            jobs: Number of worker threads rendering and writing notes
+                (worker processes for HTML, which is CPU-bound)
+            incremental: Keep a manifest in the export directory and only
+                rewrite notes that changed since the last export
+            attachment_mode: How attachments are placed (see place_file)
+            dedup_attachments: Store each distinct attachment once in a
+                content-addressed directory at the export root
+            resume: Continue an interrupted export from its journal,
+                skipping the notes and notebooks it already finished
+            progress: Report throughput and ETA here instead of printing
+                a line per note and attachment
+            sink: Where output goes: a DirectorySink (default) or an
+                ArchiveSink; the exporter closes it. Manifests and
+                checkpoint journals are only kept for directory exports.
+            note_filter: Only export the notes matching this filter; only
+                notebooks holding matching notes get a directory
+        """
+        self.db = db
+        self.format_type = format_type
+        self.include_metadata = include_metadata
+        self.jobs = max(1, jobs)
+        self.incremental = incremental
+        self.attachment_mode = attachment_mode
+        self.dedup_attachments = dedup_attachments
+        self.resume = resume
+        self.progress = progress
+        self.sink = sink or DirectorySink()
+        self.note_filter = note_filter or None
+        self.content_store: Optional[ContentStore] = None
+        self.manifest: Optional[ExportManifest] = None
+        self.journal: Optional[ExportJournal] = None
+        self.search_index = SearchIndex() if format_type == "html" else None
+        # Folder tree the search index names notebooks from, fetched once per export
+        self._index_tree: Optional[FolderTree] = None
+        # Worker processes only pay off with more than one CPU to run them on
+        self._processes = self.search_index is not None and self.jobs > 1 and (os.cpu_count() or 1) > 1
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs) if self.jobs > 1 and not self._processes else None
+        self._pool_paths = 0
+        self._pending: deque = deque()
+        self._claimed: set = set()
+        self._exported_folders: set = set()
+        self._filled_folders: set = set()
+        self._folder_dirs: Dict[str, Path] = {}
+        self._note_paths: Dict[str, Path] = {}
+        self._site_root: Optional[Path] = None
+        self._top_folders: List[str] = []
+        self._folder_notes: Dict[str, List[Tuple[str, Path]]] = {}
+        self._resources_by_id: Optional[Dict[str, sqlite3.Row]] = None
+        self._attachment_files: Dict[str, List[Path]] = {}
+        self._note_links: Dict[str, Dict[str, Optional[str]]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+    def close(self, complete: bool = True):
+        """
+        Finish the export. When it did not complete, notes already written
+        stay in the journal for --resume and nothing is pruned.
+        """
+        try:
+            self._drain(0)
+            if self.search_index is not None and complete and self._site_root is not None:
+                self._write_site()
+            if self.manifest and complete:
+                for folder_id, folder_dir in self._folder_dirs.items():
+                    if self.manifest.root in folder_dir.parents:
+                        self.manifest.record_folder(folder_id, folder_dir)
+                # A run over the whole tree also cleans up after deleted notebooks
+                full_tree = self._site_root == self.manifest.root and self._exported_folders >= set(self.db.folder_tree().nodes)
+                scope = None if full_tree else self._exported_folders
+                filtered = set()
+                if self.note_filter:
+                    # Notes still in the exported notebooks were dropped by the filter, not deleted
+                    filtered = self.db.get_note_ids_in_folders(self.manifest.unseen(scope), self._exported_folders)
+                removed = self.manifest.prune(scope, filtered)
+                if not self.progress:
+                    for path in removed:
+                        print(f" ✗ {self.manifest.root / path}")
+                self.manifest.save()
+                self._log(f"Incremental export: {self.manifest.summary()}")
+        except BaseException:
+            complete = False
+            raise
+        finally:
+            if self._pool:
+                self._pool.shutdown(wait=complete)
+                self._pool = None
+            try:
+                self.sink.close(complete)
+            except BaseException:
+                complete = False
+                raise
+            finally:
+                if self.journal:
+                    self.journal.close(complete)
+                    self.journal = None
+
+    def plan(self, folders: List[sqlite3.Row], out_dir: Path):
+        """
+        Lay out the output directories and note files for these notebooks.
+
+        Planning every notebook of an export before writing any of them lets
+        links between notes in different notebooks be rewritten to relative
+        paths. Notebooks that were already planned are skipped.
+        """
+        tree = self.db.folder_tree()
+        folders = [folder for folder in folders if folder["id"] not in self._folder_dirs]
+        if self.progress:
+            self.progress.add_totals(self.db.get_export_totals([folder["id"] for folder in folders], self.note_filter))
+        if self._site_root is None:
+            self._site_root = out_dir
+        for folder in folders:
+            if out_dir == self._site_root:
+                self._top_folders.append(folder["id"])
+            for node in tree.walk(folder["id"]):
+                parent_dir = self._folder_dirs.get(node.parent_id, out_dir) if node.id != folder["id"] else out_dir
+                self._folder_dirs[node.id] = parent_dir / node.title
+                if not self.note_filter:
+                    self.sink.makedirs(self._folder_dirs[node.id])
+                self._exported_folders.add(node.id)
+
+            # Title order decides who gets the plain name when titles collide
+            for summary in self.db.iter_note_summaries_in_subtree(folder["id"], self.note_filter):
+                if self.note_filter and summary["parent_id"] not in self._filled_folders:
+                    self.sink.makedirs(self._folder_dirs[summary["parent_id"]])
+                    self._filled_folders.add(summary["parent_id"])
+                file_path = self._claim_path(self._folder_dirs[summary["parent_id"]], summary)
+                self._note_paths[summary["id"]] = file_path
+                if self.search_index is not None:
+                    self._folder_notes.setdefault(summary["parent_id"], []).append((summary["title"], file_path))
+
+    def export_notebook(self, folder: sqlite3.Row, out_dir: Path):
+        """
+        Export a notebook and all of its sub-notebooks below out_dir.
+
+        Runs a constant number of queries however many notes there are: the
+        folder hierarchy comes from the cached tree, output paths are planned
+        from one body-less pass, and the notes themselves are streamed from a
+        single cursor that already carries their tags and resource IDs.
+        """
+        options = {"format": self.format_type, "include_metadata": self.include_metadata,
+                   "dedup_attachments": self.dedup_attachments}
+        # A filter decides which notes a mirror holds and which notebooks
+        # count as finished, so changing it rebuilds and resuming needs the same one
+        if self.note_filter:
+            options["filter"] = self.note_filter.options()
+        on_disk = isinstance(self.sink, DirectorySink)
+        if self.incremental and on_disk and self.manifest is None:
+            self.manifest = ExportManifest(out_dir, options)
+        if on_disk and self.journal is None:
+            self.journal = ExportJournal(out_dir, options, self.resume)
+        if self.dedup_attachments and self.content_store is None:
+            self.content_store = ContentStore(out_dir / ContentStore.DIR_NAME, self.attachment_mode, self.sink)
+
+        self.plan([folder], out_dir)
+        paths = self._note_paths
+
+        # Notes a previous, interrupted run already wrote (note ID -> hash)
+        done = self.journal.notes if self.journal else {}
+        if self.journal and folder["id"] in self.journal.folders:
+            self._log(f"  Already exported “{folder['title']}”, skipping")
+            # The search index needs the bodies of skipped notes too
+            rows = (self.db.iter_notes_for_export if self.search_index else self.db.iter_note_summaries_in_subtree)(
+                folder["id"], note_filter=self.note_filter)
+            for summary in rows:
+                if self.manifest:
+                    self.manifest.record(summary, paths[summary["id"]], done.get(summary["id"]), False)
+                self._skipped(summary)
+            return
+
+        resources_by_id = self._resources()
+        for note in self.db.iter_notes_for_export(folder["id"], note_filter=self.note_filter):
+            file_path = paths[note["id"]]
+            if note["id"] in done:
+                if self.manifest:
+                    self.manifest.record(note, file_path, done[note["id"]], False)
+                self._skipped(note)
+                continue
+            if self.manifest:
+                links = self._link_targets(note)
+                if self.manifest.is_current(note, file_path, links):
+                    self.manifest.record(note, file_path, None, False)
+                    self._skipped(note)
+                    continue
+                self._note_links[note["id"]] = links
+            tags, resources, saved_files = self._note_extras(note, resources_by_id, file_path.parent)
+            if self.manifest and not self.content_store:
+                # Per-note attachment files go when the note does (stored ones are shared)
+                self._attachment_files[note["id"]] = [file_path.parent / path for path in saved_files.values()]
+            entry = self.manifest.lookup(note["id"]) if self.manifest else None
+            previous_hash = entry["hash"] if entry else None
+            # Files can be written as soon as they are rendered, but archive
+            # entries are added in submission order by _finish
+            sink = self.sink if self.sink.concurrent else None
+            if self._processes:
+                # Rows cannot be pickled, and workers already hold the note paths
+                self._submit(note, file_path, render_note_job, file_path,
+                             {key: note[key] for key in self.RENDER_COLUMNS}, tags,
+                             [{key: r[key] for key in ("id", "title", "filename")} for r in resources],
+                             self.format_type, self.include_metadata, saved_files, previous_hash, self._new_paths(), sink)
+            else:
+                self._submit(note, file_path, render_note_job, file_path, note, tags, resources,
+                             self.format_type, self.include_metadata, saved_files, previous_hash, paths, sink)
+        self._drain(0)
+        if self.journal:
+            self.journal.folder_done(folder["id"])
+
+    def _link_targets(self, note: sqlite3.Row) -> Dict[str, Optional[str]]:
+        """
+        Where the notes and attachments a note links to are exported (None
+        for targets outside the export); its rendered links depend on these.
+        """
+        resources = self._resources()
+        targets: Dict[str, Optional[str]] = {}
+        for target_id in JOPLIN_LINK_RE.findall(note["body"] or ""):
+            if target_id in self._note_paths:
+                targets[target_id] = self.manifest.relative(self._note_paths[target_id])
+            elif target_id in resources:
+                targets[target_id] = attachment_filename(resources[target_id])
+            else:
+                targets[target_id] = None
+        return targets
+
+    def _resources(self) -> Dict[str, sqlite3.Row]:
+        """Resource metadata keyed by ID, loaded once per export run (empty without metadata)."""
+        if self._resources_by_id is None:
+            self._resources_by_id = self.db.get_resources_by_id() if self.include_metadata else {}
+        return self._resources_by_id
+
+    def _note_extras(self, note: sqlite3.Row, resources_by_id: Dict[str, sqlite3.Row], out_dir: Path) -> Tuple[List[str], List[sqlite3.Row], Dict[str, str]]:
+        """
+        Tags and resources of an export row, extracting its attachments below
+        out_dir when metadata is included.
+
+        Returns:
+            (tags, resources, resource IDs mapped to attachment paths relative to out_dir)
+        """
+        sep = JoplinDB.LIST_SEPARATOR
+        tags = sorted(note["tag_titles"].split(sep)) if note["tag_titles"] else []
+        resource_ids = set(note["resource_ids"].split(sep)) if note["resource_ids"] else set()
+        if resources_by_id and note["body"]:
+            # note_resources can lag behind the body; attach whatever it links to
+            resource_ids.update(JOPLIN_LINK_RE.findall(note["body"]))
+        resources = sorted(
+            (resources_by_id[rid] for rid in resource_ids if rid in resources_by_id),
+            key=lambda r: r["title"],
+        )
+        saved_files = {}
+        if self.include_metadata and resources:
+            verbose = self.progress is None
+            if self.content_store:
+                saved_files = store_attachments_deduplicated(self.db, resources, out_dir, self.content_store, verbose)
+            else:
+                saved_files = extract_attachments(self.db, resources, note["title"], out_dir,
+                                                  self.attachment_mode, verbose, self.sink)
+            if self.progress:
+                self.progress.attachments_done(
+                    len(saved_files), sum(max(r["size"] or 0, 0) for r in resources if r["id"] in saved_files))
+        return tags, resources, saved_files
+
+    def _claim_path(self, out_dir: Path, note: sqlite3.Row) -> Path:
+        """Pick the output file for a note, disambiguating duplicate titles by ID."""
+        name = safe_name(note["title"])
+        extension = note_extension(self.format_type)
+        file_path = out_dir / f"{name}.{extension}"
+        # index.html is the notebook's own page in HTML exports
+        if file_path in self._claimed or (self.search_index is not None and file_path.name == "index.html"):
+            file_path = out_dir / f"{name} ({note['id'][:8]}).{extension}"
+        self._claimed.add(file_path)
+        return file_path
+
+    def _new_paths(self) -> Optional[Dict[str, Path]]:
+        """Note paths planned since the worker processes started (None if there are none)."""
+        if self._pool is None or self._pool_paths == len(self._note_paths):
+            return None
+        return dict(itertools.islice(self._note_paths.items(), self._pool_paths, None))
+
+    def _submit(self, note: sqlite3.Row, file_path: Path, fn, *args):
+        if self._processes and self._pool is None:
+            # One pool for the whole run; workers get the planned note paths once
+            self._pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_render_worker,
+                                             initargs=(self._note_paths,))
+            self._pool_paths = len(self._note_paths)
+        if not self._pool:
+            self._finish(note, file_path, fn(*args))
+            return
+        self._pending.append((note, file_path, self._pool.submit(fn, *args)))
+        # Bound the number of in-flight notes so memory stays flat
+        self._drain(self.jobs * 4)
+
+    def _drain(self, keep: int):
+        """Wait for pending notes, in order, until at most `keep` remain."""
+        while len(self._pending) > keep:
+            note, file_path, future = self._pending.popleft()
+            self._finish(note, file_path, future.result())
+
+    def _finish(self, note: sqlite3.Row, file_path: Path, result: Tuple[str, Optional[bytes], int, Optional[List[str]]]):
+        content_hash, data, bytes_written, terms = result
+        if self.search_index is not None:
+            self._index_note(note, file_path, terms)
+        if data is not None and not self.sink.concurrent:
+            self.sink.write(file_path, data, note["updated_time"] / 1000)
+        if self.journal:
+            self.journal.note_done(note["id"], content_hash)
+        if self.manifest:
+            self.manifest.record(note, file_path, content_hash, bytes_written > 0,
+                                 self._attachment_files.pop(note["id"], None), self._note_links.pop(note["id"], None))
+        if self.progress:
+            self.progress.note_done(bytes_written)
+        elif bytes_written:
+            print(f" → {file_path}")
+
+    def _skipped(self, note: sqlite3.Row):
+        """Account for a note that needs no rewrite."""
+        if self.search_index is not None:
+            self._index_note(note, self._note_paths[note["id"]], SearchIndex.terms(note["title"], note["body"]))
+        if self.progress:
+            self.progress.note_done()
+
+    def _href(self, path: Path, start: Path) -> str:
+        return quote(os.path.relpath(path, start).replace(os.sep, "/"))
+
+    def _index_note(self, note: sqlite3.Row, file_path: Path, terms: List[str]):
+        if self._index_tree is None:
+            self._index_tree = self.db.folder_tree()
+        notebook = self._index_tree.path(note["parent_id"])
+        notebook_href = self._href(file_path.parent, self._site_root) + "/"
+        self.search_index.add(note["title"], quote(file_path.name), notebook, notebook_href, terms)
+
+    def _write_site(self):
+        """Write the index page of every exported notebook, the root index and the search page."""
+        tree = self.db.folder_tree()
+        root = self._site_root
+        # Filtered exports only create the notebooks holding matching notes,
+        # so only those and the notebooks above them get an index page
+        shown = set(self._folder_dirs)
+        if self.note_filter:
+            shown = {node.id for folder_id in self._filled_folders
+                     for node in tree.ancestors(folder_id) if node.id in self._folder_dirs}
+
+        def notebook_links(folder_ids: List[str], start: Path) -> List[Tuple[str, str, int]]:
+            return [(tree.get(fid).title, self._href(self._folder_dirs[fid] / "index.html", start),
+                     len(self._folder_notes.get(fid, []))) for fid in folder_ids if fid in shown]
+
+        for folder_id, folder_dir in self._folder_dirs.items():
+            if folder_id not in shown:
+                continue
+            children = [child.id for child in tree.children(folder_id) if child.id in self._folder_dirs]
+            notes = [(title, self._href(path, folder_dir)) for title, path in self._folder_notes.get(folder_id, [])]
+            root_href = self._href(root, folder_dir) + "/"
+            self.sink.write(folder_dir / "index.html", render_index_page(
+                tree.path(folder_id), notebook_links(children, folder_dir), notes, root_href, "../index.html").encode("utf-8"))
+        self.sink.write(root / "index.html", render_index_page(
+            "Joplin notebooks", notebook_links(self._top_folders, root), [], "").encode("utf-8"))
+        self.sink.write(root / "search.html", render_search_page().encode("utf-8"))
+        self.search_index.write(self.sink, root)
+
+    def _log(self, message: str):
+        if self.progress:
+            self.progress.log(message)
+        else:
+            print(message)
+
+    def summary(self) -> Dict[str, Any]:
+        """Final progress figures (plus incremental change counts) as a JSON-able dict."""
+        result = self.progress.finish() if self.progress else {}
+        if self.manifest:
+            result["incremental"] = dict(self.manifest.stats)
+        return result
+
+class NotebookFileExporter(NotebookExporter):
+    """
+    Export each notebook into a single Markdown or text file instead of one
+    file per note (the per-notebook layout).
+
+    A notebook's file sits next to the directory holding its sub-notebooks
+    and attachments (`Work.md` beside `Work/`). It opens with a table of
+    contents linking to an anchor before each note, and links between notes
+    point at those anchors. With subtree, sub-notebooks are written into the
+    file of the exported notebook as further sections instead of getting
+    files of their own. Notes are streamed from one title-ordered cursor per
+    notebook through a large write buffer, so memory use does not grow with
+    the size of a notebook.
+    """
+
+    # Bytes of a notebook file kept in memory before it spills to a
+    # temporary file on its way into an archive
+    SPOOL_SIZE = 1024 * 1024
+
+    def __init__(self, db: JoplinDB, format_type: str = "md", include_metadata: bool = False, subtree: bool = False, attachment_mode: str = "copy", dedup_attachments: bool = False, progress: Optional[ExportProgress] = None, sink=None, note_filter: Optional[NoteFilter] = None):
+        """
+        Args:
+            db: Database instance
+            format_type: "md" for markdown, "txt" for plain text
+            include_metadata: Whether to include metadata in exported files
+            subtree: Write sub-notebooks into their exported notebook's file
+            attachment_mode: How attachments are placed (see place_file)
+            dedup_attachments: Store each distinct attachment once in a
+                content-addressed directory at the export root
+            progress: Report throughput and ETA instead of printing a line per file
+            sink: A DirectorySink (default) or an ArchiveSink; the exporter closes it
+            note_filter: Only export the notes matching this filter; notebooks
+                without matching notes get no file
+        """
+        super().__init__(db, format_type, include_metadata, attachment_mode=attachment_mode,
+                         dedup_attachments=dedup_attachments, progress=progress, sink=sink, note_filter=note_filter)
+        self.subtree = subtree
+        self._files: Dict[str, Path] = {}
+        self._toc_notes: Dict[str, List[Tuple[str, str]]] = {}
+
+    def plan(self, folders: List[sqlite3.Row], out_dir: Path):
+        """Lay out the notebook files (and the directories of their attachments) for these notebooks."""
+        tree = self.db.folder_tree()
+        folders = [folder for folder in folders if folder["id"] not in self._folder_dirs]
+        if self.progress:
+            self.progress.add_totals(self.db.get_export_totals([folder["id"] for folder in folders], self.note_filter))
+        extension = note_extension(self.format_type)
+        for folder in folders:
+            for node in tree.walk(folder["id"]):
+                parent_dir = self._folder_dirs.get(node.parent_id, out_dir) if node.id != folder["id"] else out_dir
+                self._folder_dirs[node.id] = parent_dir / node.title
+                if self.subtree and node.id != folder["id"]:
+                    self._files[node.id] = self._files[folder["id"]]
+                    continue
+                file_path = parent_dir / f"{safe_name(node.title)}.{extension}"
+                if file_path in self._claimed:
+                    file_path = parent_dir / f"{safe_name(node.title)} ({node.id[:8]}).{extension}"
+                self._claimed.add(file_path)
+                self._files[node.id] = file_path
+
+            for summary in self.db.iter_note_summaries_in_subtree(folder["id"], self.note_filter):
+                self._note_paths[summary["id"]] = self._files[summary["parent_id"]]
+                self._toc_notes.setdefault(summary["parent_id"], []).append((summary["title"], summary["id"]))
+
+    def export_notebook(self, folder: sqlite3.Row, out_dir: Path):
+        """Export a notebook and its sub-notebooks below out_dir, one file per notebook (or one in all with subtree)."""
+        if self.dedup_attachments and self.content_store is None:
+            self.content_store = ContentStore(out_dir / ContentStore.DIR_NAME, self.attachment_mode, self.sink)
+        self.plan([folder], out_dir)
+
+        resources_by_id = self._resources()
+        nodes = [node for node in self.db.folder_tree().walk(folder["id"]) if self._has_file(node.id)]
+        if self.subtree:
+            if nodes:
+                self._write_file(self._files[folder["id"]], nodes, resources_by_id)
+        else:
+            for node in nodes:
+                self._write_file(self._files[node.id], [node], resources_by_id)
+
+    def _has_file(self, folder_id: str) -> bool:
+        # Filtered exports leave out notebooks without matching notes
+        return not self.note_filter or folder_id in self._toc_notes
+
+    def _write_file(self, file_path: Path, nodes: List[FolderNode], resources_by_id: Dict[str, sqlite3.Row]):
+        self.sink.makedirs(file_path.parent)
+        chunks = self._render_file(file_path, nodes, resources_by_id)
+        if isinstance(self.sink, DirectorySink):
+            tmp_path = partial_path(file_path)
+            try:
+                with open(tmp_path, "wb", buffering=COPY_CHUNK_SIZE) as out:
+                    for chunk in chunks:
+                        out.write(chunk)
+                os.replace(tmp_path, file_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        else:
+            # Archive entries need their size up front; large files spill to disk
+            spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+            try:
+                for chunk in chunks:
+                    spool.write(chunk)
+                self.sink.write_stream(file_path, spool)
+            except BaseException:
+                spool.close()
+                raise
+        if not self.progress:
+            print(f" → {file_path}")
 
-    def get_all_folders(self) -> List[sqlite3.Row]:
-        """Get all folders (including subfolders)."""
-        return self._exec("SELECT * FROM folders ORDER BY title")
+    def _render_file(self, file_path: Path, nodes: List[FolderNode], resources_by_id: Dict[str, sqlite3.Row]):
+        """Yield the encoded content of a notebook file: heading, table of contents, then every note."""
+        tree = self.db.folder_tree()
+        md = self.format_type == "md"
+        for index, node in enumerate(nodes):
+            title = tree.path(node.id)
+            if md:
+                yield f'<a id="notebook-{node.id}"></a>\n\n# {title}\n\n'.encode("utf-8")
+            else:
+                yield f"{title}\n{'#' * len(title)}\n\n".encode("utf-8")
+            if index == 0:
+                yield self._contents(file_path, nodes).encode("utf-8")
 
-    def get_note(self, note_id: str) -> Optional[sqlite3.Row]:
-        rows = self._exec("SELECT * FROM notes WHERE id = ?", (note_id,))
-        return rows[0] if rows else None
+            folder_dir = self._folder_dirs[node.id]
+            for note in self.db.iter_notes_for_export(node.id, by_title=True, note_filter=self.note_filter):
+                tags, resources, saved_files = self._note_extras(note, resources_by_id, folder_dir)
+                # Attachments live in the notebook's directory, next to the file
+                saved_files = {rid: os.path.relpath(folder_dir / path, file_path.parent) for rid, path in saved_files.items()}
+                body = rewrite_links(note["body"] or "", file_path.parent, self._note_paths, saved_files, anchors=md)
+                text = render_note(note, tags, resources, self.format_type, self.include_metadata, saved_files, body)
+                if md:
+                    # Notes become second-level sections below the notebook heading
+                    text = f'<a id="note-{note["id"]}"></a>\n\n#{text}'
+                data = f"{text}\n".encode("utf-8")
+                if self.progress:
+                    self.progress.note_done(len(data))
+                yield data
 
-    def get_notes_in_folder(self, folder_id: str) -> List[sqlite3.Row]:
-        return self._exec(
-            "SELECT * FROM notes WHERE parent_id = ? ORDER BY title", (folder_id,)
-        )
+    def _contents(self, file_path: Path, nodes: List[FolderNode]) -> str:
+        """Table of contents of a notebook file, plus links to the files of its sub-notebooks."""
+        md = self.format_type == "md"
 
-    def get_tags_for_note(self, note_id: str) -> List[str]:
-        sql = """
-            SELECT t.title
-            FROM tags t
-            JOIN note_tags nt ON t.id = nt.tag_id
-            WHERE nt.note_id = ?
-            ORDER BY t.title
-        """
-        return [row["title"] for row in self._exec(sql, (note_id,))]
+        def label(text: str) -> str:
+            return text.replace("[", "\\[").replace("]", "\\]") if md else text
 
-    def get_resources_for_note(self, note_id: str) -> List[sqlite3.Row]:
-        sql = """
-            SELECT r.*
-            FROM resources r
-            JOIN note_resources nr ON r.id = nr.resource_id
-            WHERE nr.note_id = ?
-            ORDER BY r.title
-        """
-        return self._exec(sql, (note_id,))
+        out: List[str] = ["**Contents**\n\n" if md else "Contents:\n"]
+        base_depth = len(self.db.folder_tree().ancestors(nodes[0].id))
+        for node in nodes:
+            depth = len(self.db.folder_tree().ancestors(node.id)) - base_depth
+            if node is not nodes[0]:
+                entry = f"[{label(node.title)}](#notebook-{node.id})" if md else node.title
+                out.append(f"{'  ' * (depth - 1)}- {entry}\n")
+            for title, note_id in self._toc_notes.get(node.id, []):
+                entry = f"[{label(title)}](#note-{note_id})" if md else title
+                out.append(f"{'  ' * depth}- {entry}\n")
+        if len(out) == 1:
+            out.append("(No notes)\n")
 
-    def get_resource_data(self, resource_id: str) -> Optional[bytes]:
-        """Get the binary data for a resource."""
-        rows = self._exec("SELECT data FROM resources WHERE id = ?", (resource_id,))
-        return rows[0]["data"] if rows else None
+        if not self.subtree:
+            children = [child for child in self.db.folder_tree().children(nodes[0].id) if self._has_file(child.id)]
+            if children:
+                out.append("\n**Sub-notebooks**\n\n" if md else "\nSub-notebooks:\n")
+                for child in children:
+                    if md:
+                        href = quote(os.path.relpath(self._files[child.id], file_path.parent).replace(os.sep, "/"))
+                        out.append(f"- [{label(child.title)}]({href})\n")
+                    else:
+                        out.append(f"- {child.title} ({os.path.relpath(self._files[child.id], file_path.parent)})\n")
+        out.append("\n---\n\n" if md else "\n" + "-" * 40 + "\n\n")
+        return "".join(out)
 
-    def search_notes(self, term: str) -> List[sqlite3.Row]:
-        """Search notes using both FTS and traditional methods for comprehensive results."""
-        try:
-            # First try FTS search for broader matches
-            sql_fts = """
-                SELECT n.*, n.parent_id as notebook_id
-                FROM notes_fts ft
-                JOIN notes n ON ft.rowid = n.rowid
-                WHERE notes_fts MATCH ?
-                LIMIT 50
-            """
-            fts_results = self._exec(sql_fts, (term,))
-            
-            # Also try case-insensitive LIKE search in titles and content for partial matches
-            sql_like = """
-                SELECT DISTINCT n.*, n.parent_id as notebook_id
-                FROM notes n
-                WHERE LOWER(n.title) LIKE LOWER(?)
-                OR LOWER(n.body) LIKE LOWER(?)
-                LIMIT 20
-            """
-            # Add wildcards for partial matching
-            like_term = f"%{term}%"
-            like_results = self._exec(sql_like, (like_term, like_term))
-            
-            # Combine and deduplicate results
-            all_results = fts_results + like_results
-            seen_ids = set()
-            unique_results = []
-            for result in all_results:
-                if result['id'] not in seen_ids:
-                    seen_ids.add(result['id'])
-                    unique_results.append(result)
-            
-            return unique_results[:50]  # Limit to 50 total results
-            
-        except sqlite3.OperationalError:
-            # If FTS fails, fall back to LIKE search only
-            sql_fallback = """
-                SELECT n.*, n.parent_id as notebook_id
-                FROM notes n
-                WHERE LOWER(n.title) LIKE LOWER(?)
-                OR LOWER(n.body) LIKE LOWER(?)
-                LIMIT 50
-            """
-            like_term = f"%{term}%"
-            return self._exec(sql_fallback, (like_term, like_term))
+# Export layouts: a file per note, a file per notebook, or a file per
+# exported notebook including its sub-notebooks
+EXPORT_LAYOUTS = ("per-note", "per-notebook", "per-tree")
 
-    def close(self):
-        self.conn.close()
+def make_exporter(db: JoplinDB, layout: str = "per-note", format_type: str = "md", include_metadata: bool = False, jobs: int = 1, incremental: bool = False, attachment_mode: str = "copy", dedup_attachments: bool = False, resume: bool = False, progress: Optional[ExportProgress] = None, sink=None, note_filter: Optional[NoteFilter] = None) -> NotebookExporter:
+    """
+    Create the exporter for a layout (see EXPORT_LAYOUTS). Notebook files are
+    written by a single thread and kept neither incrementally nor in a
+    journal, so jobs, incremental and resume only apply to per-note exports.
+    """
+    if layout == "per-note":
+        return NotebookExporter(db, format_type, include_metadata, jobs, incremental, attachment_mode,
+                                dedup_attachments, resume, progress, sink, note_filter)
+    return NotebookFileExporter(db, format_type, include_metadata, layout == "per-tree", attachment_mode,
+                                dedup_attachments, progress, sink, note_filter)
 
-# ----------------------------------------------------------------------
-# Export utilities
-# ----------------------------------------------------------------------
-def extract_attachments(db: JoplinDB, resources: List[sqlite3.Row], note_title: str, out_dir: Path) -> Dict[str, str]:
+def export_notebook_recursive(db: JoplinDB, folder: sqlite3.Row, out_dir: Path, format_type: str = "md", include_metadata: bool = False, jobs: int = 1, quiet: bool = False, layout: str = "per-note", note_filter: Optional[NoteFilter] = None) -> Dict[str, Any]:
     """
-    Extract and save file attachments from a note.
+    Export a notebook recursively to the specified format.
     
     Args:
         db: Database instance
-        resources: List of resource rows for the note
-        note_title: Title of the note (used for creating directory name)
-        out_dir: Output directory for the note
-        
+        folder: Current folder to export
+        out_dir: Output directory
+        format_type: "md" for markdown, "txt" for plain text, "html" for HTML
+        include_metadata: Whether to include metadata in exported files
+        jobs: Number of worker threads (processes for HTML) rendering and writing notes
+        quiet: Suppress the progress line
+        layout: One of EXPORT_LAYOUTS
+        note_filter: Only export the notes matching this filter
+
     Returns:
-        Dict mapping resource titles to their saved file paths
+        Summary of the export (see ExportProgress.finish)
     """
-    saved_files = {}
-    
-    if not resources:
-        return saved_files
-    
-    # Create attachments directory
-    safe_title = "".join(c if c not in r'\/:*?"<>|' else "_" for c in note_title)
-    attachments_dir = out_dir / "attachments" / safe_title
-    attachments_dir.mkdir(parents=True, exist_ok=True)
-    
-    print(f"    Extracting {len(resources)} attachments...")
-    
-    for resource in resources:
-        try:
-            resource_data = db.get_resource_data(resource["id"])
-            if not resource_data:
-                print(f"    ⚠️  No data found for resource: {resource['title']}")
-                continue
-                
-            # Use original filename if available, otherwise use title or ID
-            filename = resource.get("filename") or resource.get("title", f"resource_{resource['id'][:8]}")
-            
-            # Ensure filename is safe for filesystem
-            safe_filename = "".join(c if c not in r'\/:*?"<>|' else "_" for c in filename)
-            
-            # If no extension, try to determine from mime type
-            if "." not in safe_filename:
-                mime = resource.get("mime", "")
-                if mime.startswith("image/"):
-                    ext = mime.split("/")[-1]
-                    if ext:
-                        safe_filename = f"{safe_filename}.{ext}"
-                elif mime == "application/pdf":
-                    safe_filename = f"{safe_filename}.pdf"
-                elif mime.startswith("text/"):
-                    ext = mime.split("/")[-1] or "txt"
-                    safe_filename = f"{safe_filename}.{ext}"
-            
-            file_path = attachments_dir / safe_filename
-            
-            # Write the data
-            with open(file_path, "wb") as f:
-                f.write(resource_data)
-            
-            saved_files[resource["title"]] = str(file_path.relative_to(out_dir))
-            print(f"    ✓ {safe_filename} ({resource.get('mime', 'unknown')})")
-            
-        except Exception as e:
-            print(f"    ❌ Failed to extract {resource['title']}: {e}")
-    
-    return saved_files
+    with make_exporter(db, layout, format_type, include_metadata, jobs, progress=ExportProgress(quiet),
+                       note_filter=note_filter) as exporter:
+        exporter.export_notebook(folder, out_dir)
+    return exporter.summary()
 
-def export_note_to_format(note: sqlite3.Row, tags: List[str], resources: List[sqlite3.Row], out_dir: Path, format_type: str = "md", include_metadata: bool = False, db: Optional[JoplinDB] = None):
+def export_jsonl(db: JoplinDB, folders: List[sqlite3.Row], out, progress: Optional[ExportProgress] = None, include_body: bool = True, note_filter: Optional[NoteFilter] = None) -> Dict[str, Any]:
     """
-    Export a note to either markdown (.md) or text (.txt) format.
-    
-    Args:
-        note: The note row from database
-        tags: List of tags for the note
-        resources: List of resources/attachments for the note
-        out_dir: Output directory
-        format_type: "md" for markdown, "txt" for plain text
-        include_metadata: Whether to include metadata (timestamps, tags, attachments)
-        db: Database instance (required for extracting attachments)
+    Write one JSON object per note below these notebooks (matching
+    note_filter) to the text stream `out` (see note_to_json), streamed row
+    by row from the export cursor.
+
+    Returns:
+        Summary of the export (see ExportProgress.finish)
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
-    safe_title = "".join(c if c not in r'\/:*?"<>|' else "_" for c in note["title"])
-    extension = "md" if format_type.lower() == "md" else "txt"
-    file_path = out_dir / f"{safe_title}.{extension}"
+    tree = db.folder_tree()
+    if progress:
+        progress.add_totals(db.get_export_totals([folder["id"] for folder in folders], note_filter))
+    sep = JoplinDB.LIST_SEPARATOR
+    notebooks: Dict[str, str] = {}
+    for folder in folders:
+        for note in db.iter_notes_for_export(folder["id"], note_filter=note_filter):
+            parent_id = note["parent_id"]
+            if parent_id not in notebooks:
+                notebooks[parent_id] = tree.path(parent_id)
+            tags = sorted(note["tag_titles"].split(sep)) if note["tag_titles"] else []
+            resource_ids = sorted(set(note["resource_ids"].split(sep))) if note["resource_ids"] else []
+            line = json.dumps(note_to_json(note, tags, resource_ids, notebooks[parent_id], include_body), ensure_ascii=False)
+            out.write(line + "\n")
+            if progress:
+                progress.note_done(len(line) + 1)
+    return progress.finish() if progress else {}
 
-    # Extract attachments if database is provided and metadata is included
-    saved_files = {}
-    if include_metadata and db and resources:
-        saved_files = extract_attachments(db, resources, note["title"], out_dir)
+# Formats that export raw Joplin items (re-importable by Joplin) instead of notebooks
+RAW_FORMATS = ("jex", "raw")
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        if format_type.lower() == "md":
-            # Markdown format
-            f.write(f"# {note['title']}\n\n")
-            
-            if include_metadata:
-                f.write(f"*Created:* {ts_to_str(note['created_time'])}\n")
-                f.write(f"*Updated:* {ts_to_str(note['updated_time'])}\n")
-                if tags:
-                    f.write(f"*Tags:* {', '.join(tags)}\n")
-                f.write("\n---\n\n")
-            
-            f.write(note["body"] or "")
-            f.write("\n")
-
-            if include_metadata and resources:
-                f.write("\n## Attachments\n")
-                for res in resources:
-                    # Use saved file path if available, otherwise use original filename
-                    if res["title"] in saved_files:
-                        f.write(f"- [{res['title']}]({saved_files[res['title']]})\n")
-                    else:
-                        f.write(f"- [{res['title']}]({res['filename'] or 'unknown'})\n")
-        else:
-            # Plain text format
-            f.write(f"{note['title']}\n")
-            f.write("=" * len(note['title']) + "\n\n")
-            
-            if include_metadata:
-                f.write(f"Created: {ts_to_str(note['created_time'])}\n")
-                f.write(f"Updated: {ts_to_str(note['updated_time'])}\n")
-                if tags:
-                    f.write(f"Tags: {', '.join(tags)}\n")
-                f.write("\n" + "-" * 40 + "\n\n")
-            
-            f.write(note["body"] or "")
-            f.write("\n")
-
-            if include_metadata and resources:
-                f.write("\n\nAttachments:\n")
-                for res in resources:
-                    if res["title"] in saved_files:
-                        f.write(f"- {res['title']} ({saved_files[res['title']]})\n")
-                    else:
-                        f.write(f"- {res['title']} ({res['filename'] or 'unknown'})\n")
-                    
-    print(f" → {file_path}")
+# Item properties Joplin serializes as ISO 8601 UTC timestamps
+ITEM_TIME_FIELDS = {"created_time", "updated_time", "user_created_time", "user_updated_time", "sync_time"}
 
-def export_notebook_recursive(db: JoplinDB, folder: sqlite3.Row, out_dir: Path, format_type: str = "md", include_metadata: bool = False):
+def format_item_value(name: str, value: Any) -> str:
+    """Format one property the way Joplin's BaseItem.serialize does."""
+    if name in ITEM_TIME_FIELDS:
+        if not value:
+            return ""
+        stamp = datetime.fromtimestamp(value // 1000, timezone.utc)
+        return f"{stamp.strftime('%Y-%m-%dT%H:%M:%S')}.{value % 1000:03d}Z"
+    if value is None:
+        return ""
+    return str(value).replace("\n", "\\n").replace("\r", "\\r")
+
+def serialize_item(row: sqlite3.Row, item_type: int) -> str:
     """
-    Export a notebook recursively to the specified format.
-    
-    Args:
-        db: Database instance
-        folder: Current folder to export
-        out_dir: Output directory
-        format_type: "md" for markdown, "txt" for plain text
-        include_metadata: Whether to include metadata in exported files
+    Serialize a database row in Joplin's item format: the title, the body
+    (if any), then one `key: value` line per property, ending with type_,
+    separated by blank lines.
     """
-    folder_dir = out_dir / folder["title"]
-    folder_dir.mkdir(parents=True, exist_ok=True)
+    keys = row.keys()
+    parts = []
+    if "title" in keys:
+        parts.append(format_item_value("title", row["title"]))
+    if "body" in keys and row["body"]:
+        parts.append(row["body"])
+    props = [f"{key}: {format_item_value(key, row[key])}" for key in keys if key not in ("title", "body")]
+    props.append(f"type_: {item_type}")
+    parts.append("\n".join(props))
+    return "\n\n".join(parts)
 
-    # Export notes in this folder
-    notes = db.get_notes_in_folder(folder["id"])
-    for note in notes:
-        tags = db.get_tags_for_note(note["id"])
-        resources = db.get_resources_for_note(note["id"])
-        export_note_to_format(note, tags, resources, folder_dir, format_type, include_metadata, db)
+def export_raw_items(db: JoplinDB, sink, root: Path, attachment_mode: str = "copy", progress: Optional[ExportProgress] = None) -> Dict[str, Any]:
+    """
+    Export every folder, tag, note, note-tag link and resource as Joplin
+    raw items: `<id>.md` per item plus `resources/<id>.<ext>` files, the
+    layout of Joplin's RAW export (and, in a tar, of a JEX file).
 
-    # Recurse into sub-folders
-    subfolders = db.get_folders(folder["id"])
-    for sub in subfolders:
-        export_notebook_recursive(db, sub, folder_dir, format_type, include_metadata)
+    Each table is streamed from its own cursor straight into the sink, so
+    memory stays flat however many items there are. The sink is closed.
+
+    Returns:
+        Summary of the export (see ExportProgress.finish)
+    """
+    if progress:
+        progress.add_totals(db.get_item_totals())
+    complete = False
+    try:
+        sink.makedirs(root / "resources")
+        for table, item_type in JoplinDB.ITEM_TYPES.items():
+            for row in db.iter_items(table):
+                data = serialize_item(row, item_type).encode("utf-8")
+                mtime = row["updated_time"] / 1000 if row["updated_time"] else None
+                sink.write(root / f"{row['id']}.md", data, mtime)
+                if table == "notes" and progress:
+                    progress.note_done(len(data))
+                if table == "resources":
+                    source = db.resource_store.path_for(row)
+                    if not source:
+                        print(f"    ⚠️  Resource file not found: {row['title']}")
+                        continue
+                    sink.add_file(source, root / "resources" / source.name, attachment_mode)
+                    if progress:
+                        progress.attachments_done(1, max(row["size"] or 0, 0))
+        complete = True
+    finally:
+        sink.close(complete)
+    return progress.finish() if progress else {}
 
 # ----------------------------------------------------------------------
 # Interactive shell
 # ----------------------------------------------------------------------
-def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_format: str = "md", include_metadata: bool = False):
+# How many candidates to fetch (and show) when resolving a short ID
+AMBIGUOUS_MATCH_LIMIT = 10
+
+# Number of search hits shown per page
+SEARCH_PAGE_SIZE = 50
+
+def parse_search_args(arg: str) -> Tuple[str, Optional[int], int]:
+    """
+    Split `s` options from the search term.
+
+    Supports `--limit N` (page size), `--all` (no limit) and `--page N`.
+
+    Returns:
+        (term, limit, page) where limit is None for --all
+    """
+    limit: Optional[int] = SEARCH_PAGE_SIZE
+    page = 1
+    tokens = arg.split()
+    while tokens and tokens[0].startswith("--"):
+        option = tokens.pop(0)
+        if option == "--all":
+            limit = None
+        elif option in {"--limit", "--page"}:
+            if not tokens or not tokens[0].isdigit() or int(tokens[0]) < 1:
+                raise ValueError(f"{option} needs a positive number")
+            value = int(tokens.pop(0))
+            if option == "--limit":
+                limit = value
+            else:
+                page = value
+        else:
+            raise ValueError(f"Unknown option: {option}")
+    return " ".join(tokens), limit, page
+
+def pop_json_flag(arg: str) -> Tuple[str, bool]:
+    """Strip a `--json` option from a command's arguments."""
+    tokens = arg.split()
+    if "--json" not in tokens:
+        return arg, False
+    return " ".join(token for token in tokens if token != "--json"), True
+
+def print_json(data: Dict[str, Any]):
+    print(json.dumps(data, ensure_ascii=False))
+
+def print_notes_json(db: JoplinDB, notes: List[sqlite3.Row], extra: Optional[Dict[str, Dict[str, Any]]] = None):
+    """Print body-less notes as JSON lines, looking up their tags and resources in one batch."""
+    ids = [note["id"] for note in notes]
+    tags = db.get_tags_for_notes(ids)
+    resource_ids = db.get_resource_ids_for_notes(ids)
+    tree = db.folder_tree()
+    for note in notes:
+        data = note_to_json(note, tags.get(note["id"], []), resource_ids.get(note["id"], []),
+                            tree.path(note["parent_id"]), include_body=False)
+        if extra:
+            data.update(extra.get(note["id"], {}))
+        print_json(data)
+
+def print_search_page(db: JoplinDB, search: Dict[str, Any], as_json: bool = False) -> Tuple[int, bool]:
+    """
+    Print one page of search results as they are read from the cursor.
+
+    `search` holds the term, page size, page number and keyset cursor; the
+    cursor is advanced so the next call continues where this one stopped.
+    With as_json, each hit is printed as a JSON line (see note_to_json, plus
+    score and snippet); hits are flushed in batches of SEARCH_PAGE_SIZE so
+    their tags and resources take one query per batch.
+
+    Returns:
+        (number of hits printed, whether more hits are available)
+    """
+    limit = search["limit"]
+    offset = (search["page"] - 1) * limit if search["after"] is None and limit else 0
+    # Fetch one extra row to find out whether another page exists
+    rows = db.iter_search_notes(
+        search["term"],
+        limit=None if limit is None else limit + 1,
+        after=search["after"],
+        offset=offset,
+    )
+    # Notebook paths come from the cached folder tree, not per-hit queries
+    tree = db.folder_tree()
+    shown = 0
+    has_more = False
+    batch: List[sqlite3.Row] = []
+
+    def flush():
+        print_notes_json(db, batch, {
+            hit["id"]: {"score": hit["score"], "snippet": " ".join((hit["snippet"] or "").split())} for hit in batch
+        })
+        batch.clear()
+
+    try:
+        for result in rows:
+            if limit is not None and shown == limit:
+                has_more = True
+                break
+            if as_json:
+                batch.append(result)
+                if len(batch) == SEARCH_PAGE_SIZE:
+                    flush()
+                shown += 1
+                search["after"] = (result["score"], result["id"])
+                continue
+            if shown == 0:
+                print(f"\nSearch results for '{search['term']}' (page {search['page']}):")
+            # Show notebook context if available
+            notebook_id = result["notebook_id"]
+            notebook_prefix = f"{notebook_id[:8]}/" if notebook_id else ""
+            notebook_path = tree.path(notebook_id)
+            location = f"  (📁 {notebook_path})" if notebook_path else ""
+            print(f"  [{notebook_prefix}{result['id'][:8]}] {result['title']}{location}")
+            snippet = " ".join((result["snippet"] or "").split())
+            if snippet:
+                print(f"      {snippet}")
+            shown += 1
+            search["after"] = (result["score"], result["id"])
+        if batch:
+            flush()
+    finally:
+        rows.close()
+    return shown, has_more
+
+def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_format: str = "md", include_metadata: bool = False, export_jobs: int = 1, incremental: bool = False, attachment_mode: str = "copy", dedup_attachments: bool = False, export_layout: str = "per-note", note_filter: Optional[NoteFilter] = None):
     print("\n=== Joplin Shell ===")
     print("Browse, search, and export your Joplin notes.\n")
     print("Commands:")
     print("  l                 - List folders/notes at current location")
+    print("  tags              - List all tags with their note counts")
     
     print("  cd <folder-id>    - Navigate into folder")
     print("  cd ..             - Go back to parent folder")
     print("  cd /              - Go back to root level")
     print("  s <search-term>   - Search all notes (full-text search)")
+    print("  more              - Show the next page of search results")
     print("  n <note-id>       - View full note content")
     print("  n <notebook-id>/<note-id> - View note with notebook context")
     print("  cat <note-id>     - View note content (no metadata)")
@@ -518,6 +3427,8 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
     print("  less <note-id>    - View note in less pager")
     print("  vim <note-id>     - Open note in Vim editor")
     print(f"  e [note-id]       - Export to {export_format.upper()} (current folder or single note)")
+    print("  e --jobs N        - Export current folder using N worker threads")
+    print("  l, s, n, tags --json - Print one JSON object per line instead")
     print("  q                 - Quit")
     print()
     print("Quick start:")
@@ -531,21 +3442,14 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
 
     current_folder_id: Optional[str] = None
     history = []  # for '..' navigation
+    last_search: Optional[Dict[str, Any]] = None  # for 'more'
 
     while True:
         # ------------------------------------------------------------------
         # Build prompt
         # ------------------------------------------------------------------
-        path_parts = []
-        fid = current_folder_id
-        while fid:
-            folder = next((f for f in db.get_folders() if f["id"] == fid), None)
-            if not folder:
-                break
-            path_parts.append(folder["title"])
-            fid = folder["parent_id"]
-        path_parts.reverse()
-        prompt = "/".join(path_parts) if path_parts else "(root)"
+        tree = db.folder_tree()
+        prompt = tree.path(current_folder_id) or "(root)"
         cmd = safe_input(f"{prompt} > ").strip()
 
         if not cmd:
@@ -566,26 +3470,41 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
         # List
         # ------------------------------------------------------------------
         if action in {"l", "list"}:
-            folders = db.get_folders(current_folder_id)
-            notes = db.get_notes_in_folder(current_folder_id) if current_folder_id else []
+            folders = tree.children(current_folder_id)
+            notes = db.get_note_summaries_in_folder(current_folder_id) if current_folder_id else []
+
+            if pop_json_flag(arg)[1]:
+                counts = db.get_folder_note_counts() if folders else {}
+                for f in folders:
+                    direct, subtree = counts.get(f["id"], (0, 0))
+                    print_json({"type": "folder", "id": f["id"], "title": f["title"], "parent_id": f["parent_id"],
+                                "notebook": tree.path(f["id"]), "notes": direct, "notes_total": subtree})
+                for start in range(0, len(notes), SEARCH_PAGE_SIZE):
+                    chunk = notes[start:start + SEARCH_PAGE_SIZE]
+                    print_notes_json(db, chunk, {n["id"]: {"type": "note"} for n in chunk})
+                continue
 
             if current_folder_id:
-                current_folder_name = next((f["title"] for f in db.get_folders() if f["id"] == current_folder_id), "Unknown Folder")
+                current_folder = tree.get(current_folder_id)
+                current_folder_name = current_folder.title if current_folder else "Unknown Folder"
                 print(f"\n=== {current_folder_name} ===")
             else:
                 print("\n=== Your Joplin Notebooks ===")
 
             if folders:
+                counts = db.get_folder_note_counts()
                 if current_folder_id is None:
                     print("\nNotebooks:")
-                    for f in folders:
-                        note_count = len(db.get_notes_in_folder(f["id"]))
-                        print(f"  [{f['id'][:8]}] 📁 {f['title']} ({note_count} notes)")
+                    icon = "📁"
                 else:
                     print("\nSubnotebooks:")
-                    for f in folders:
-                        note_count = len(db.get_notes_in_folder(f["id"]))
-                        print(f"  [{f['id'][:8]}] 📂 {f['title']} ({note_count} notes)")
+                    icon = "📂"
+                for f in folders:
+                    direct, subtree = counts.get(f["id"], (0, 0))
+                    if subtree != direct:
+                        print(f"  [{f['id'][:8]}] {icon} {f['title']} ({direct} notes, {subtree} incl. subnotebooks)")
+                    else:
+                        print(f"  [{f['id'][:8]}] {icon} {f['title']} ({direct} notes)")
             else:
                 if current_folder_id is None:
                     print("(No notebooks)")
@@ -593,9 +3512,10 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                     print("(No subnotebooks)")
 
             if notes:
+                note_tags = db.get_tags_for_folder(current_folder_id)
                 print(f"\nNotes ({len(notes)}):")
                 for n in notes:
-                    tag_str = ", ".join(db.get_tags_for_note(n["id"])) or "—"
+                    tag_str = ", ".join(note_tags.get(n["id"], [])) or "—"
                     print(f"  [{n['id'][:8]}] 📄 {n['title']} | tags: {tag_str}")
             else:
                 print("(No notes)")
@@ -603,6 +3523,23 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
             continue
 
 
+        # ------------------------------------------------------------------
+        # Tags
+        # ------------------------------------------------------------------
+        if action == "tags":
+            as_json = pop_json_flag(arg)[1]
+            shown = 0
+            for tag in db.iter_tags_with_counts():
+                shown += 1
+                if as_json:
+                    print_json({"id": tag["id"], "title": tag["title"], "notes": tag["notes"],
+                                "created_time": tag["created_time"], "updated_time": tag["updated_time"]})
+                else:
+                    print(f"  [{tag['id'][:8]}] 🏷  {tag['title']} ({tag['notes']} notes)")
+            if not shown and not as_json:
+                print("(No tags)")
+            continue
+
         # ------------------------------------------------------------------
         # Change directory
         # ------------------------------------------------------------------
@@ -626,15 +3563,12 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                     continue
                     
                 # Try to find folder by id prefix (first 8 chars are enough) - case insensitive
-                arg_lower = arg.lower()
-                
                 # First check subfolders of current location
-                candidates = [f for f in db.get_folders(current_folder_id) if f["id"].lower().startswith(arg_lower)]
+                candidates = db.find_by_id_prefix("folders", arg, parent_id=current_folder_id or "", limit=AMBIGUOUS_MATCH_LIMIT)
                 
                 # If not found, search all folders (for root-level notebooks)
                 if not candidates:
-                    all_folders = db.get_all_folders()
-                    candidates = [f for f in all_folders if f["id"].lower().startswith(arg_lower)]
+                    candidates = db.find_by_id_prefix("folders", arg, limit=AMBIGUOUS_MATCH_LIMIT)
                 
                 if len(candidates) == 1:
                     if current_folder_id:
@@ -652,22 +3586,34 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
         # ------------------------------------------------------------------
         # Helper function to find note by ID (with folder context)
         # ------------------------------------------------------------------
-        def find_note_in_context(note_id: str) -> Optional[sqlite3.Row]:
+        def find_note_in_context(note_id: str, with_body: bool = True) -> Optional[sqlite3.Row]:
+            # IDs are resolved against body-less summaries; the full row is
+            # only loaded once a single note has been picked
+            note = resolve_note_summary(note_id)
+            if note and with_body:
+                return db.get_note(note["id"])
+            return note
+
+        def resolve_note_summary(note_id: str) -> Optional[sqlite3.Row]:
             # Handle path format: notebook-id/note-id
             if '/' in note_id:
                 notebook_id, note_id = note_id.split('/', 1)
                 
-                # Get all folders and find the notebook
-                all_folders = db.get_all_folders()
-                notebook_folder = next((f for f in all_folders if f["id"].startswith(notebook_id)), None)
+                # Find the notebook by ID prefix
+                notebooks = db.find_by_id_prefix("folders", notebook_id, limit=AMBIGUOUS_MATCH_LIMIT)
                 
-                if not notebook_folder:
+                if not notebooks:
                     print(f"Notebook {notebook_id[:8]} not found.")
                     return None
+                if len(notebooks) > 1:
+                    print("Ambiguous notebook ID - multiple notebooks match:")
+                    for f in notebooks:
+                        print(f"  [{f['id'][:8]}] {f['title']}")
+                    return None
+                notebook_folder = notebooks[0]
                 
                 # Now look for the note in that specific notebook
-                notes_in_notebook = db.get_notes_in_folder(notebook_folder["id"])
-                matching_notes = [n for n in notes_in_notebook if n["id"].startswith(note_id)]
+                matching_notes = db.find_by_id_prefix("notes", note_id, parent_id=notebook_folder["id"], limit=AMBIGUOUS_MATCH_LIMIT)
                 
                 if len(matching_notes) == 1:
                     return matching_notes[0]
@@ -681,36 +3627,44 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                     return None
             
             # Standard behavior (no path format)
-            # First try to get note globally (full ID)
-            note = db.get_note(note_id)
+            # Prefer matches in the current folder, then fall back to all notes
+            matching_notes = []
+            if current_folder_id:
+                matching_notes = db.find_by_id_prefix("notes", note_id, parent_id=current_folder_id, limit=AMBIGUOUS_MATCH_LIMIT)
+            if not matching_notes:
+                matching_notes = db.find_by_id_prefix("notes", note_id, limit=AMBIGUOUS_MATCH_LIMIT)
             
-            # If not found and we're in a folder, try partial match within current folder
-            if not note and current_folder_id:
-                notes_in_folder = db.get_notes_in_folder(current_folder_id)
-                matching_notes = [n for n in notes_in_folder if n["id"].startswith(note_id)]
-                if len(matching_notes) == 1:
-                    note = matching_notes[0]
-                elif len(matching_notes) > 1:
-                    print("Ambiguous ID - multiple notes match:")
-                    for n in matching_notes:
-                        print(f"  [{n['id'][:8]}] {n['title']}")
-                    return None
+            if len(matching_notes) == 1:
+                return matching_notes[0]
+            elif len(matching_notes) > 1:
+                print("Ambiguous ID - multiple notes match:")
+                for n in matching_notes:
+                    print(f"  [{n['id'][:8]}] {n['title']}")
+                return None
             
-            return note
+            print(f"Note {note_id[:8]} not found.")
+            return None
 
         # ------------------------------------------------------------------
         # Show note details (full view)
         # ------------------------------------------------------------------
         if action in {"n", "note", "view", "read", "show"}:
-            note_id = arg
+            note_id, as_json = pop_json_flag(arg)
             if not note_id:
-                print("Usage: n <note-id>")
+                print("Usage: n [--json] <note-id>")
                 continue
                 
-            note = find_note_in_context(note_id)
+            note = find_note_in_context(note_id, with_body=False)
             if not note:
                 continue
 
+            if as_json:
+                resource_ids = [r["id"] for r in db.get_resources_for_note(note["id"])]
+                data = note_to_json(note, db.get_tags_for_note(note["id"]), resource_ids, tree.path(note["parent_id"]), include_body=False)
+                data["body"] = db.get_note_body(note["id"]) or ""
+                print_json(data)
+                continue
+
             print(f"\n=== {note['title']} ===")
             print(f"ID: {note['id']}")
             print(f"Created: {ts_to_str(note['created_time'])}")
@@ -733,7 +3687,7 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                 print("\nAttachments: (none)")
                 
             print(f"\n--- Content ---")
-            content = note["body"]
+            content = db.get_note_body(note["id"])
             if content:
                 print_wrapped(content, indent=0)
             else:
@@ -750,12 +3704,12 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                 print("Usage: cat <note-id>")
                 continue
                 
-            note = find_note_in_context(note_id)
+            note = find_note_in_context(note_id, with_body=False)
             if not note:
                 continue
 
             print(f"# {note['title']}\n")
-            content = note["body"]
+            content = db.get_note_body(note["id"])
             if content:
                 print(content)
             else:
@@ -881,42 +3835,45 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
         # ------------------------------------------------------------------
         # Search
         # ------------------------------------------------------------------
-        if action in {"s", "search", "find"}:
-            if not arg:
-                print("Usage: s <search-term>")
-                continue
+        if action in {"s", "search", "find", "more"}:
+            if action == "more":
+                if not last_search:
+                    print("No search to continue. Use: s <search-term>")
+                    continue
+                last_search["page"] += 1
+            else:
+                arg, as_json = pop_json_flag(arg)
+                try:
+                    term, limit, page = parse_search_args(arg)
+                except ValueError as e:
+                    print(e)
+                    term = ""
+                if not term:
+                    print("Usage: s [--json] [--limit N | --all] [--page N] <search-term>")
+                    continue
+                last_search = {"term": term, "limit": limit, "page": page, "after": None, "json": as_json}
+                if not as_json:
+                    print(f"Searching for: '{term}'...")
             
-            print(f"Searching for: '{arg}'...")
-            # SQLite FTS is already case-insensitive by default
-            results = db.search_notes(arg)
+            # SQLite FTS is case-insensitive; results stream in ranked by relevance
+            shown, has_more = print_search_page(db, last_search, last_search["json"])
+
+            if last_search["json"]:
+                # Keep the output pure JSON lines; 'more' still continues the search
+                if not has_more:
+                    last_search = None
+                continue
             
-            if not results:
-                print("No matches found.")
+            if not shown:
+                print("No more matches." if action == "more" else "No matches found.")
+                last_search = None
                 continue
                 
-            print(f"\nSearch results for '{arg}' ({len(results)} hits):")
-            for result in results:
-                # Access results as sqlite3.Row objects
-                note_id = result['id']
-                note_title = result['title']
-                # Get notebook_id (folder ID that contains this note)
-                try:
-                    notebook_id = result['notebook_id']
-                except (KeyError, IndexError):
-                    notebook_id = ''
-                
-                # Show notebook context if available
-                notebook_path = ""
-                if notebook_id and notebook_id != "":
-                    # Get the notebook/folder for this note
-                    notebooks = db.get_folders()  # Get all folders
-                    notebook = next((f for f in notebooks if f['id'] == notebook_id), None)
-                    if notebook:
-                        notebook_path = f"{notebook['id'][:8]}/"
-                    else:
-                        notebook_path = f"{notebook_id[:8]}/"
-                print(f"  [{notebook_path}{note_id[:8]}] {note_title}")
-            print()
+            print(f"\n{shown} hits on page {last_search['page']}.")
+            if has_more:
+                print("💡 Type 'more' for the next page.")
+            else:
+                last_search = None
             print("💡 Tip: Use the full path format (notebook-id/note-id) with n, cat, or vim commands!")
             print()
             continue
@@ -926,19 +3883,32 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
         # ------------------------------------------------------------------
         if action == "e":
             export_dir = export_root or Path("./joplin_export")
+            jobs = export_jobs
+            if arg.startswith("--jobs"):
+                job_parts = arg.split(maxsplit=2)
+                if len(job_parts) < 2 or not job_parts[1].isdigit() or int(job_parts[1]) < 1:
+                    print("Usage: e [--jobs N] [note-id]")
+                    continue
+                jobs = int(job_parts[1])
+                arg = job_parts[2] if len(job_parts) > 2 else ""
             if not arg:
                 # Export *current* notebook (or everything if at root)
-                if current_folder_id is None:
-                    print("Exporting **all** notebooks…")
-                    for top in db.get_folders(None):
-                        export_notebook_recursive(db, top, export_dir, export_format, include_metadata)
-                else:
-                    folder = next((f for f in db.get_folders() if f["id"] == current_folder_id), None)
-                    if folder:
-                        print(f"Exporting notebook “{folder['title']}”…")
-                        export_notebook_recursive(db, folder, export_dir, export_format, include_metadata)
+                if note_filter:
+                    print(f"Only notes matching: {note_filter.describe()}")
+                with make_exporter(db, export_layout, export_format, include_metadata, jobs, incremental, attachment_mode,
+                                   dedup_attachments, note_filter=note_filter) as exporter:
+                    if current_folder_id is None:
+                        print("Exporting **all** notebooks…")
+                        exporter.plan(tree.children(None), export_dir)
+                        for top in tree.children(None):
+                            exporter.export_notebook(top, export_dir)
                     else:
-                        print("Current folder not found.")
+                        folder = tree.get(current_folder_id)
+                        if folder:
+                            print(f"Exporting notebook “{folder['title']}”…")
+                            exporter.export_notebook(folder, export_dir)
+                        else:
+                            print("Current folder not found.")
                 print(f"\nExport finished → {export_dir.resolve()}")
             else:
                 # Export single note (supporting notebook-id/note-id format)
@@ -947,10 +3917,9 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
                     continue
                 tags = db.get_tags_for_note(note["id"])
                 resources = db.get_resources_for_note(note["id"])
-                export_note_to_format(note, tags, resources, export_dir, export_format, include_metadata, db)
-                safe_title = "".join(c if c not in r'\/:*?"<>|' else "_" for c in note["title"])
-                extension = "md" if export_format.lower() == "md" else "txt"
-                print(f"Exported → {export_dir / f'{safe_title}.{extension}'}")
+                export_note_to_format(note, tags, resources, export_dir, export_format, include_metadata, db, attachment_mode)
+                file_name = f"{safe_name(note['title'])}.{note_extension(export_format)}"
+                print(f"Exported → {export_dir / file_name}")
             continue
 
         # ------------------------------------------------------------------
@@ -961,16 +3930,21 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
             print("Browse, search, and export your Joplin notes.\n")
             print("Commands:")
             print("  l                 - List folders/notes at current location")
+            print("  tags              - List all tags with their note counts")
             
             print("  cd <folder-id>    - Navigate into folder")
             print("  cd ..             - Go back to parent folder")
             print("  cd /              - Go back to root level")
             print("  s <search-term>   - Search all notes (full-text search)")
+            print("      --limit N, --all, --page N  - Page size, no paging, or jump to a page")
+            print("  more              - Show the next page of search results")
             print("  n <note-id>       - View full note content with metadata")
             print("  cat <note-id>     - View note content (no metadata)")
             print("  less <note-id>    - View note in less pager")
             print("  vim <note-id>     - Open note in Vim editor")
             print("  e [note-id]       - Export to Markdown (current folder or single note)")
+            print("  e --jobs N        - Export current folder using N worker threads")
+            print("  l, s, n, tags --json - Print one JSON object per line instead")
             print("  h, help, ?        - Show this help message")
             print("  q                 - Quit")
             print()
@@ -989,7 +3963,7 @@ def interactive_shell(db: JoplinDB, export_root: Optional[Path] = None, export_f
         # ------------------------------------------------------------------
         # Unknown command
         # ------------------------------------------------------------------
-        print("Unknown command. Available: l, cd <id>, n <id>, s <term>, cat <id>, less <id>, vim <id>, e [id], h, q")
+        print("Unknown command. Available: l, cd <id>, n <id>, s <term>, more, cat <id>, less <id>, vim <id>, e [id], h, q")
 
 # ----------------------------------------------------------------------
 # Main entry point
@@ -1013,27 +3987,218 @@ def main():
     )
     parser.add_argument(
         "--export-format",
-        choices=["md", "txt"],
+        choices=["md", "txt", "html", "jsonl", *RAW_FORMATS],
         default="md",
-        help="Export format: 'md' for Markdown or 'txt' for plain text (default: md)",
+        help="Export format: 'md' for Markdown, 'txt' for plain text, 'html' for a browsable static site "
+             "with notebook index pages and client-side search, 'jsonl' for one JSON object per note "
+             "(a single file, or stdout with --export-archive -), or Joplin's own item format for re-import: "
+             "'jex' (a single .jex file) or 'raw' (a directory) (default: md)",
+    )
+    parser.add_argument(
+        "--export-layout",
+        choices=EXPORT_LAYOUTS,
+        default="per-note",
+        help="Files to export md/txt notes into: 'per-note' (one file per note), 'per-notebook' (one file per "
+             "notebook with a table of contents) or 'per-tree' (one file per exported notebook including its "
+             "sub-notebooks) (default: per-note)",
+    )
+    parser.add_argument(
+        "--tag",
+        action="append",
+        default=[],
+        metavar="TAG",
+        help="Only export notes carrying this tag (repeat to require several tags)",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="DATE",
+        help="Only export notes updated at or after DATE (YYYY-MM-DD, YYYY-MM-DDTHH:MM, or an age like 90d, 12w, 6h)",
+    )
+    parser.add_argument(
+        "--until",
+        metavar="DATE",
+        help="Only export notes updated before DATE (same formats as --since)",
+    )
+    parser.add_argument(
+        "--todo",
+        nargs="?",
+        const="any",
+        choices=NoteFilter.TODO_STATES,
+        help="Only export to-dos: all of them, or only 'open' or 'done' ones",
+    )
+    parser.add_argument(
+        "--query",
+        metavar="TERMS",
+        help="Only export notes matching this full-text search (same syntax as the 's' command)",
     )
     parser.add_argument(
         "--export-all",
         action="store_true",
         help="Export all notebooks to the specified directory and exit (no interactive mode)",
     )
+    parser.add_argument(
+        "--export-archive",
+        metavar="FILE",
+        help="Export all notebooks into a single .tar, .tar.gz, .tar.zst or .zip archive instead of a directory "
+             "('-' streams a tar to stdout) and exit",
+    )
+    parser.add_argument(
+        "--archive-format",
+        choices=ArchiveSink.FORMATS,
+        help="Archive format for --export-archive (default: from the file name; tar for stdout)",
+    )
+    parser.add_argument(
+        "--resources-dir",
+        type=Path,
+        help="Directory holding Joplin's attachment files (default: resources/ next to database.sqlite)",
+    )
+    parser.add_argument(
+        "--attachments",
+        choices=ATTACHMENT_MODES,
+        default="copy",
+        help="How exported attachments are created: copy, reflink (copy-on-write clone on btrfs/XFS), "
+             "hardlink (shares data with the Joplin profile - do not edit!) or symlink; "
+             "falls back to copy when unsupported (default: copy)",
+    )
+    parser.add_argument(
+        "--dedup-attachments",
+        action="store_true",
+        help=f"Store each distinct attachment once in a content-addressed {ContentStore.DIR_NAME}/ directory "
+             "at the export root and link notes to it",
+    )
     parser.add_argument(
         "--include-metadata",
         action="store_true",
         help="Include metadata (timestamps, tags, attachments) in exported files (default: disabled)",
     )
+    parser.add_argument(
+        "--no-body",
+        action="store_true",
+        help="With --export-format jsonl, leave the note bodies out and export metadata only",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="Number of worker threads used to render and write exported notes; html uses worker processes "
+             "(default: 1, or one per CPU for html)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep a manifest in the export directory and only rewrite notes that changed since the last export",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="With --export-all, print nothing but errors and the final JSON summary",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="With --export-all, continue an interrupted export from the journal in the export directory",
+    )
     parser.add_argument(
         "--write",
         action="store_true",
         help="Enable write mode - allows vim command to save changes back to database (default: read-only)",
     )
+    parser.add_argument(
+        "--immutable",
+        action="store_true",
+        help="Open the database as an immutable snapshot (no locking; only for files nothing else is writing to)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        nargs="?",
+        const="memory",
+        choices=["memory", "temp"],
+        help="Copy the database into a consistent private snapshot (in memory by default, or a temp file) and work on that",
+    )
+    parser.add_argument(
+        "--mmap-size",
+        type=int,
+        default=JoplinDB.DEFAULT_MMAP_SIZE // (1024 * 1024),
+        metavar="MB",
+        help="Memory-map up to this many MB of the database file; 0 disables mmap (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=JoplinDB.DEFAULT_CACHE_SIZE // (1024 * 1024),
+        metavar="MB",
+        help="SQLite page cache size in MB (default: %(default)s)",
+    )
     
     args = parser.parse_args()
+    if args.jobs is None:
+        args.jobs = (os.cpu_count() or 1) if args.export_format == "html" else 1
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    try:
+        note_filter = NoteFilter(args.tag, args.since, args.until, args.todo, args.query)
+    except ValueError as e:
+        parser.error(str(e))
+    if note_filter and args.export_format in RAW_FORMATS:
+        parser.error(f"--export-format {args.export_format} exports every item; export filters do not apply")
+    if args.export_layout != "per-note":
+        if args.export_format not in ("md", "txt"):
+            parser.error(f"--export-layout {args.export_layout} only applies to md and txt exports")
+        for option, value in (("--incremental", args.incremental), ("--resume", args.resume)):
+            if value:
+                parser.error(f"--export-layout {args.export_layout} cannot be combined with {option}")
+    if args.export_format in RAW_FORMATS:
+        if not (args.export_all or args.export_archive):
+            parser.error(f"--export-format {args.export_format} requires --export-all or --export-archive")
+        for option, value in (("--incremental", args.incremental), ("--resume", args.resume),
+                              ("--dedup-attachments", args.dedup_attachments)):
+            if value:
+                parser.error(f"--export-format {args.export_format} cannot be combined with {option}")
+        if args.export_format == "jex":
+            if args.export_dir:
+                parser.error("--export-format jex writes a single file; name it with --export-archive")
+            if args.archive_format not in (None, "tar"):
+                parser.error("JEX files are uncompressed tar archives")
+            args.export_archive = args.export_archive or "joplin_export.jex"
+            args.archive_format = "tar"
+    if args.no_body and args.export_format != "jsonl":
+        parser.error("--no-body only applies to --export-format jsonl")
+    if args.export_format == "jsonl":
+        if not (args.export_all or args.export_archive):
+            parser.error("--export-format jsonl requires --export-all or --export-archive")
+        if args.export_dir or args.archive_format:
+            parser.error("--export-format jsonl writes a single file; name it with --export-archive (- for stdout)")
+        for option, value in (("--incremental", args.incremental), ("--resume", args.resume),
+                              ("--dedup-attachments", args.dedup_attachments), ("--include-metadata", args.include_metadata)):
+            if value:
+                parser.error(f"--export-format jsonl cannot be combined with {option}")
+        args.export_archive = args.export_archive or "joplin_export.jsonl"
+    if args.export_archive:
+        for option, value in (("--export-dir", args.export_dir), ("--incremental", args.incremental),
+                              ("--resume", args.resume), ("--attachments", args.attachments != "copy")):
+            if value:
+                parser.error(f"--export-archive cannot be combined with {option}")
+        if not args.archive_format and args.export_format != "jsonl":
+            try:
+                args.archive_format = ArchiveSink.format_for(args.export_archive)
+            except ValueError as e:
+                parser.error(str(e))
+        if args.export_archive == "-":
+            if sys.stdout.isatty():
+                parser.error("refusing to write an export to a terminal")
+            # stdout carries the export; send every message to stderr
+            sys.stdout = sys.stderr
+        args.export_all = True
+    elif args.archive_format:
+        parser.error("--archive-format requires --export-archive")
+    if args.resume and not args.export_all:
+        parser.error("--resume requires --export-all")
+    if args.quiet and not args.export_all:
+        parser.error("--quiet requires --export-all")
+    if args.immutable and args.write:
+        parser.error("--immutable cannot be combined with --write")
+    if args.snapshot and args.write:
+        parser.error("--snapshot cannot be combined with --write (edits would only change the snapshot)")
     
     global WRITE_MODE
     WRITE_MODE = args.write
@@ -1065,33 +4230,111 @@ def main():
             print("Could not auto-detect database.sqlite. Please provide the path explicitly.")
             sys.exit(1)
 
-    print(f"Opening database: {db_path}")
+    if not args.quiet:
+        print(f"Opening database: {db_path}")
     try:
-        db = JoplinDB(db_path)
+        db = JoplinDB(
+            db_path,
+            read_only=not WRITE_MODE,
+            immutable=args.immutable,
+            mmap_size=args.mmap_size * 1024 * 1024,
+            cache_size=args.cache_size * 1024 * 1024,
+            resources_dir=args.resources_dir,
+        )
     except Exception as e:
         print(f"Failed to open database: {e}")
         sys.exit(1)
 
+    if args.snapshot:
+        if not args.quiet:
+            print(f"Taking {args.snapshot} snapshot of the database...")
+        try:
+            db.snapshot(args.snapshot)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Failed to snapshot database: {e}")
+            db.close()
+            sys.exit(1)
+
+    try:
+        db.filter_sql(note_filter)
+    except ValueError as e:
+        print(f"Invalid --query: {e}", file=sys.stderr)
+        db.close()
+        sys.exit(2)
+
     try:
         # Handle direct export mode
         if args.export_all:
-            export_dir = args.export_dir or Path("./joplin_export")
-            print(f"Exporting all notebooks to {export_dir.resolve()} in {args.export_format.upper()} format...")
-            print(f"Metadata inclusion: {'enabled' if args.include_metadata else 'disabled'}")
-            
-            top_folders = db.get_folders(None)
-            if not top_folders:
-                print("No notebooks found to export.")
+            sink = None
+            if args.export_format == "jsonl":
+                export_dir = None
+                destination = "stdout" if args.export_archive == "-" else str(Path(args.export_archive).resolve())
+            elif args.export_archive:
+                try:
+                    sink = ArchiveSink(args.export_archive, args.archive_format)
+                except (ValueError, OSError) as e:
+                    print(f"Cannot create archive: {e}", file=sys.stderr)
+                    sys.exit(1)
+                export_dir = sink.root
+                destination = "stdout" if args.export_archive == "-" else str(Path(args.export_archive).resolve())
             else:
-                for folder in top_folders:
-                    print(f"Exporting notebook: {folder['title']}")
-                    export_notebook_recursive(db, folder, export_dir, args.export_format, args.include_metadata)
-                print(f"\nExport completed successfully!")
-                print(f"Files saved to: {export_dir.resolve()}")
+                export_dir = args.export_dir or Path("./joplin_export")
+                destination = str(export_dir.resolve())
+            raw = args.export_format in RAW_FORMATS
+            progress = ExportProgress(quiet=args.quiet)
+            progress.log(f"Exporting all notebooks to {destination} in {args.export_format.upper()} format...")
+            if args.export_format in ("md", "txt", "html"):
+                progress.log(f"Metadata inclusion: {'enabled' if args.include_metadata else 'disabled'}")
+            if note_filter:
+                progress.log(f"Only notes matching: {note_filter.describe()}")
+            
+            top_folders = db.folder_tree().children(None)
+            # Let a scheduler's SIGTERM unwind like Ctrl-C so the journal is kept
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+            try:
+                if raw:
+                    summary = export_raw_items(db, sink or DirectorySink(), export_dir, args.attachments, progress)
+                elif args.export_format == "jsonl" and args.export_archive == "-":
+                    summary = export_jsonl(db, top_folders, sys.__stdout__, progress, not args.no_body, note_filter)
+                elif args.export_format == "jsonl":
+                    # Written under a temporary name so a failed export leaves no partial file
+                    target = Path(args.export_archive)
+                    tmp_path = partial_path(target)
+                    try:
+                        with open(tmp_path, "w", encoding="utf-8", buffering=COPY_CHUNK_SIZE) as out:
+                            summary = export_jsonl(db, top_folders, out, progress, not args.no_body, note_filter)
+                        os.replace(tmp_path, target)
+                    finally:
+                        if tmp_path.exists():
+                            tmp_path.unlink()
+                else:
+                    with make_exporter(db, args.export_layout, args.export_format, args.include_metadata, args.jobs, args.incremental,
+                                       args.attachments, args.dedup_attachments, args.resume, progress, sink, note_filter) as exporter:
+                        if not top_folders:
+                            progress.log("No notebooks found to export.")
+                        exporter.plan(top_folders, export_dir)
+                        for folder in top_folders:
+                            progress.log(f"Exporting notebook: {folder['title']}")
+                            exporter.export_notebook(folder, export_dir)
+                    summary = exporter.summary()
+            except (OSError, sqlite3.Error, tarfile.TarError, zipfile.BadZipFile, KeyboardInterrupt, SystemExit) as e:
+                progress.finish()
+                terminated = isinstance(e, SystemExit)
+                print(f"\nExport interrupted: {'terminated' if terminated else e or type(e).__name__}", file=sys.stderr)
+                if args.export_archive:
+                    print("The incomplete export file was discarded.", file=sys.stderr)
+                elif not raw:
+                    print("Finished notes are recorded in the export directory; rerun with --resume to continue.", file=sys.stderr)
+                sys.exit(e.code if terminated else 1)
+            if top_folders:
+                progress.log(f"\nExport completed successfully!")
+                progress.log(f"Files saved to: {destination}")
+            print(json.dumps(summary))
             return
             
         # Interactive mode (existing functionality)
-        interactive_shell(db, export_root=args.export_dir, export_format=args.export_format, include_metadata=args.include_metadata)
+        interactive_shell(db, export_root=args.export_dir, export_format=args.export_format, include_metadata=args.include_metadata, export_jobs=args.jobs, incremental=args.incremental, attachment_mode=args.attachments,
+                          dedup_attachments=args.dedup_attachments, export_layout=args.export_layout, note_filter=note_filter)
     finally:
         db.close()
 
@@ -0,0 +1,230 @@
+import importlib.util
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "joplin-shell.py"
+
+
+def load_module():
+    """Import joplin-shell.py (not an importable module name) for in-process tests."""
+    spec = importlib.util.spec_from_file_location("joplin_shell", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+SCHEMA = """
+CREATE TABLE folders (id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT '', parent_id TEXT NOT NULL DEFAULT '',
+                      created_time INT NOT NULL, updated_time INT NOT NULL);
+CREATE TABLE notes (id TEXT PRIMARY KEY, parent_id TEXT NOT NULL DEFAULT '', title TEXT NOT NULL DEFAULT '',
+                    body TEXT NOT NULL DEFAULT '', created_time INT NOT NULL, updated_time INT NOT NULL,
+                    is_todo INT NOT NULL DEFAULT 0, todo_due INT NOT NULL DEFAULT 0, todo_completed INT NOT NULL DEFAULT 0,
+                    source_url TEXT NOT NULL DEFAULT '', author TEXT NOT NULL DEFAULT '');
+CREATE TABLE tags (id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT '', created_time INT NOT NULL, updated_time INT NOT NULL);
+CREATE TABLE note_tags (id TEXT PRIMARY KEY, note_id TEXT NOT NULL, tag_id TEXT NOT NULL,
+                        created_time INT NOT NULL, updated_time INT NOT NULL);
+CREATE TABLE resources (id TEXT PRIMARY KEY, title TEXT NOT NULL DEFAULT '', mime TEXT NOT NULL,
+                        filename TEXT NOT NULL DEFAULT '', file_extension TEXT NOT NULL DEFAULT '',
+                        size INT NOT NULL DEFAULT -1, created_time INT NOT NULL, updated_time INT NOT NULL);
+CREATE TABLE note_resources (id INTEGER PRIMARY KEY, note_id TEXT NOT NULL, resource_id TEXT NOT NULL,
+                             is_associated INT NOT NULL, last_seen_time INT NOT NULL);
+"""
+
+FOLDERS = [("f1", "Work", ""), ("f2", "Projects", "f1"), ("f3", "Empty", ""), ("f4", "Nested", "f3")]
+NOTES = [
+    ("n1", "f2", "Tagged", "Body of Tagged", True),
+    ("n2", "f1", "Plain", "Body of Plain", False),
+    ("n3", "f4", "Other", "Body of Other", False),
+    ("n4", "f1", "Discount", "Now 50% off", False),
+    ("n5", "f1", "Stock", "500 items left", False),
+    ("n6", "f1", "Naming", "Use snake_case names", False),
+    ("n7", "f1", "Camel", "Not snakeXcase", False),
+]
+
+
+def make_profile(root: Path) -> Path:
+    db_path = root / "database.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    now = 1700000000000
+    conn.executemany("INSERT INTO folders (id, title, parent_id, created_time, updated_time) VALUES (?, ?, ?, ?, ?)",
+                     [(fid, title, parent, now, now) for fid, title, parent in FOLDERS])
+    conn.execute("INSERT INTO tags (id, title, created_time, updated_time) VALUES ('t1', 'client-x', ?, ?)", (now, now))
+    for note_id, parent, title, body, tagged in NOTES:
+        conn.execute("INSERT INTO notes (id, parent_id, title, body, created_time, updated_time) VALUES (?, ?, ?, ?, ?, ?)",
+                     (note_id, parent, title, body, now, now))
+        if tagged:
+            conn.execute("INSERT INTO note_tags (id, note_id, tag_id, created_time, updated_time) VALUES (?, ?, 't1', ?, ?)",
+                         (f"nt-{note_id}", note_id, now, now))
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def run_export(db_path: Path, out_dir: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, str(SCRIPT), str(db_path), "--export-all", "--quiet",
+                           "--export-dir", str(out_dir), *args], capture_output=True, text=True)
+
+
+class FilteredHtmlExportTest(unittest.TestCase):
+    def test_only_notebooks_with_matching_notes_get_index_pages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            out_dir = root / "out"
+            result = run_export(make_profile(root), out_dir, "--export-format", "html", "--tag", "client-x")
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(json.loads(result.stdout.splitlines()[-1])["notes"], 1)
+
+            self.assertTrue((out_dir / "Work" / "Projects" / "Tagged.html").exists())
+            pages = sorted(str(p.relative_to(out_dir)) for p in out_dir.rglob("index.html"))
+            self.assertEqual(pages, ["Work/Projects/index.html", "Work/index.html", "index.html"])
+            self.assertFalse((out_dir / "Empty").exists())
+            self.assertNotIn("Empty/index.html", (out_dir / "index.html").read_text(encoding="utf-8"))
+            self.assertEqual(list(out_dir.rglob("*.part")), [])
+
+
+class QueryFilterTest(unittest.TestCase):
+    def export_titles(self, query: str) -> list:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            out_dir = root / "out"
+            result = run_export(make_profile(root), out_dir, "--query", query)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            return sorted(p.stem for p in out_dir.rglob("*.md"))
+
+    def test_like_fallback_matches_wildcards_literally(self):
+        # The fixture has no notes_fts table, so --query falls back to LIKE
+        self.assertEqual(self.export_titles("50%"), ["Discount"])
+        self.assertEqual(self.export_titles("snake_case"), ["Naming"])
+
+    def test_query_without_words_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            result = run_export(make_profile(root), root / "out", "--query", "***")
+            self.assertEqual(result.returncode, 2)
+            self.assertIn("no words to search for", result.stderr)
+            self.assertFalse((root / "out").exists())
+
+
+def summary_of(result: subprocess.CompletedProcess) -> dict:
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+class ProfileTestCase(unittest.TestCase):
+    """Exports a fresh profile per test, changing it between (incremental) exports."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.db_path = make_profile(self.root)
+        self.out_dir = self.root / "out"
+
+    def export(self) -> dict:
+        result = run_export(self.db_path, self.out_dir, "--incremental")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return summary_of(result)["incremental"]
+
+    def change(self, *statements):
+        conn = sqlite3.connect(self.db_path)
+        for sql, params in statements:
+            conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def files(self) -> list:
+        return sorted(p.relative_to(self.out_dir).as_posix() for p in self.out_dir.rglob("*") if p.is_file()
+                      and not p.name.startswith("."))
+
+
+class IncrementalExportTest(ProfileTestCase):
+    def test_add_modify_and_move(self):
+        self.assertEqual(self.export()["new"], len(NOTES))
+        self.change(
+            ("INSERT INTO notes (id, parent_id, title, body, created_time, updated_time) VALUES ('n8', 'f1', 'Added', '', 1, 1)", ()),
+            ("UPDATE notes SET body = 'Changed', updated_time = updated_time + 1 WHERE id = 'n2'", ()),
+            ("UPDATE notes SET parent_id = 'f3' WHERE id = 'n5'", ()),
+        )
+        stats = self.export()
+        self.assertEqual((stats["new"], stats["updated"], stats["moved"], stats["deleted"]), (1, 1, 1, 0))
+        self.assertEqual(stats["unchanged"], len(NOTES) - 2)
+        self.assertIn("Changed", (self.out_dir / "Work" / "Plain.md").read_text(encoding="utf-8"))
+        self.assertTrue((self.out_dir / "Work" / "Added.md").exists())
+        self.assertTrue((self.out_dir / "Empty" / "Stock.md").exists())
+        self.assertFalse((self.out_dir / "Work" / "Stock.md").exists())
+
+    def test_deleting_a_notebook_removes_its_files(self):
+        self.export()
+        self.change(("DELETE FROM notes WHERE parent_id IN ('f3', 'f4')", ()),
+                    ("DELETE FROM folders WHERE id IN ('f3', 'f4')", ()))
+        stats = self.export()
+        self.assertEqual(stats["deleted"], 1)
+        self.assertFalse((self.out_dir / "Empty").exists())
+        self.assertEqual(self.files(), sorted(["Work/Projects/Tagged.md", "Work/Plain.md", "Work/Discount.md",
+                                               "Work/Stock.md", "Work/Naming.md", "Work/Camel.md"]))
+
+
+class LinkRewritingTest(ProfileTestCase):
+    def test_links_follow_notes_across_notebooks(self):
+        self.change(("UPDATE notes SET body = 'See [other](:/0123456789abcdef0123456789abcdef)' WHERE id = 'n2'", ()))
+        self.change(("UPDATE notes SET id = '0123456789abcdef0123456789abcdef' WHERE id = 'n3'", ()))
+        self.export()
+        plain = self.out_dir / "Work" / "Plain.md"
+        self.assertIn("[other](../Empty/Nested/Other.md)", plain.read_text(encoding="utf-8"))
+
+        # Only the target changes, but the note linking to it must follow
+        self.change(("UPDATE notes SET title = 'Renamed', updated_time = updated_time + 1 "
+                     "WHERE id = '0123456789abcdef0123456789abcdef'", ()))
+        self.export()
+        self.assertIn("[other](../Empty/Nested/Renamed.md)", plain.read_text(encoding="utf-8"))
+        self.assertFalse((self.out_dir / "Empty" / "Nested" / "Other.md").exists())
+
+
+class ResumeTest(ProfileTestCase):
+    def test_resume_continues_an_interrupted_export(self):
+        # A directory where a note file belongs makes the export fail part way
+        blocker = self.out_dir / "Work" / "Naming.md"
+        blocker.mkdir(parents=True)
+        result = run_export(self.db_path, self.out_dir, "--resume")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("rerun with --resume", result.stderr)
+        journal = self.out_dir / ".joplin-export-journal"
+        self.assertTrue(journal.exists())
+        self.assertEqual(list(self.out_dir.rglob("*.part")), [])
+
+        blocker.rmdir()
+        result = run_export(self.db_path, self.out_dir, "--resume")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        summary = summary_of(result)
+        self.assertEqual((summary["notes"], summary["written"]), (len(NOTES), 2))
+        self.assertEqual(summary["skipped"], len(NOTES) - 2)
+        self.assertFalse(journal.exists())
+        self.assertEqual(self.files(), sorted(["Empty/Nested/Other.md", "Work/Projects/Tagged.md", "Work/Plain.md",
+                                               "Work/Discount.md", "Work/Stock.md", "Work/Naming.md", "Work/Camel.md"]))
+        self.assertIn("Use snake_case names", (self.out_dir / "Work" / "Naming.md").read_text(encoding="utf-8"))
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def test_failed_attachment_copy_leaves_no_partial_file(self):
+        module = load_module()
+
+        def fail(source, dest):
+            Path(dest).write_bytes(b"trunc")
+            raise OSError(28, "No space left on device")
+
+        module.copy_file = fail
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            source = root / "source.png"
+            source.write_bytes(b"image")
+            with self.assertRaises(OSError):
+                module.place_file(source, root / "out.png")
+            self.assertEqual(sorted(p.name for p in root.iterdir()), ["source.png"])
+
+
+if __name__ == "__main__":
+    unittest.main()